@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rmGerritUtils import gerrit_login, gerrit_pool
+from rmjirautilites import jira_pool
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+EXECUTOR_DEFAULTS = {
+    'workers': 4,
+    'max_queue': 16,
+    'project_workers': 10
+}
+
+
+def load_executor_settings():
+    '''
+    Returns the executor settings, the optional config/executor.json overrides the defaults
+    '''
+    settings = dict(EXECUTOR_DEFAULTS)
+    try:
+        with open(BASE_DIR + '/config/executor.json', 'r') as executor_file:
+            settings.update(json.load(executor_file))
+    except FileNotFoundError:
+        pass
+    return settings
+
+
+class ExecutorBusy(Exception):
+    '''
+    Raised when the queue of the comparison executor is full
+    '''
+
+
+class WarmSessions:
+    '''
+    Logged in Gerrit and Jira clients shared by the comparisons of every request, the
+    clients are kept per credential set by gerrit_pool and jira_pool
+
+    Methods
+    --------------------------------
+    gerrit(gerrit_key, creds)
+        returns the pooled Gerrit client of the credentials, see GerritSessionPool
+    jira(username, pwd)
+        returns the pooled Jira client of the credentials, see JiraClientPool
+    stats()
+        returns the statistics of both pools
+    '''
+
+    def gerrit(self, gerrit_key, creds=None):
+        return gerrit_login(gerrit_key, creds)
+
+    def jira(self, username=None, pwd=None):
+        return jira_pool.get(username, pwd)
+
+    def stats(self):
+        return {'gerrit': gerrit_pool.stats(), 'jira': jira_pool.stats()}
+
+
+class ComparisonExecutor:
+    '''
+    Worker pool started once with the app which runs the comparisons of all the requests.
+    The queue is bounded: at most workers comparisons run and max_queue wait, further
+    submissions are rejected with ExecutorBusy. The pooled Gerrit sessions keep a
+    connection alive for every project of every running comparison.
+
+    Attributes
+    --------------------------------
+    workers: <int>
+        number of comparisons running at the same time
+    max_queue: <int>
+        number of comparisons allowed to wait for a worker
+    project_workers: <int>
+        number of projects a release comparison compares at the same time
+    sessions: <WarmSessions>
+        logged in clients shared by the comparisons
+
+    Methods
+    --------------------------------
+    start()
+        starts the worker pool
+    submit(task, *args)
+        queues the task and returns its future
+    run(task, *args)
+        queues the task and waits for its result
+    stats()
+        returns the queue depth and the worker utilization
+    shutdown()
+        waits for the running comparisons and stops the pool
+    '''
+
+    def __init__(self, workers, max_queue, project_workers=EXECUTOR_DEFAULTS['project_workers']):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.project_workers = project_workers
+        # the comparisons of the same credentials share one session
+        gerrit_pool.pool_size = max(gerrit_pool.pool_size, workers * project_workers)
+        self.sessions = WarmSessions()
+        self.pool = None
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+
+    @classmethod
+    def from_config(cls):
+        return cls(**load_executor_settings())
+
+    def start(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='comparison')
+                self.started_at = time.monotonic()
+        return self
+
+    def submit(self, task, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise ExecutorBusy('Too many comparisons in progress, please try again later')
+        self.start()
+        with self.lock:
+            self.queued += 1
+        try:
+            return self.pool.submit(self.execute, task, *args)
+        except Exception:
+            with self.lock:
+                self.queued -= 1
+            self.slots.release()
+            raise
+
+    def execute(self, task, *args):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        started = time.monotonic()
+        failed = True
+        try:
+            result = task(*args)
+            failed = False
+            return result
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.busy_seconds += time.monotonic() - started
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            self.slots.release()
+
+    def run(self, task, *args):
+        return self.submit(task, *args).result()
+
+    def stats(self):
+        with self.lock:
+            uptime = time.monotonic() - self.started_at if self.started_at else 0
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'project_workers': self.project_workers,
+                'queue_depth': self.queued,
+                'running': self.running,
+                'utilization': round(self.running / self.workers, 3),
+                'busy_ratio': round(self.busy_seconds / (uptime * self.workers), 3) if uptime else 0,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'sessions': self.sessions.stats()
+            }
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
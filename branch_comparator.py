@@ -7,13 +7,61 @@ from rmGerritUtils import *
 from datetime import datetime, timedelta
 import pdb
 import copy
-import xlwt
 import xmltodict
 import configparser
 from pytz import timezone
+from urllib.parse import quote
 from rmjirautilites import *
+from log_index import shared_log_index
+from change_index import ChangeIdIndex
+from branch_watermark import shared_watermarks
+from jobs import Progress
+from run_stats import RunStats
+from report_writer import REPORT_COLUMNS, report_writer
 
 from progress_bar import *
+from concurrent.futures import ThreadPoolExecutor
+
+class BranchVariant:
+    '''
+    Paging state of one branch variant, the main branch or one of its Yocto flavors
+
+    Attributes
+    --------------------------------
+    suffix: <str>
+        branch name suffix, empty for the main branch
+    source: <str>
+        source branch of the variant
+    branch: <str>
+        target branch of the variant, the source branch for diff reports
+    offset: <int>
+        iterator for the change set
+    crossed_start: <bool>
+        flag to check current date in range or not
+    since: <datetime.datetime>
+        watermark of the previous comparison, only the changes merged since are fetched
+    previous_missing: <list>
+        changes missing in the target branch at the previous comparison
+    newest: <datetime.datetime>
+        merge time of the newest source change seen
+    seen: <set>
+        project and change id of the source changes seen
+    complete: <bool>
+        flag cleared when the paging stopped on an error
+    '''
+
+    def __init__(self, suffix, branch1, branch2):
+        self.suffix = suffix
+        self.source = branch1 + suffix
+        self.branch = (branch2 or branch1) + suffix
+        self.offset = 0
+        self.crossed_start = False
+        self.since = None
+        self.previous_missing = []
+        self.newest = None
+        self.seen = set()
+        self.complete = True
+
 
 class BranchComparison:
     '''
@@ -26,14 +74,10 @@ class BranchComparison:
         source branch name
     branch2: <str>
         target branch name
-    offset: <int>
-        iterator for the change set
-    eob: <bool>
-        flag to end of the change set
     commit: <dict>
         buffer for the iteration
-    projects_log: <list>
-        stores projects logs of the target branch of requires repos
+    projects_log: <dict>
+        change id index of the target branch log per project of the required repos
     crossed_start: <bool>
         flag to check current date in range or not
     stage_1_data: <list>
@@ -46,12 +90,59 @@ class BranchComparison:
         end date time
     is_dev_specific: <bool>
         device specific flag
-    repos_to_be_checked: <list>
-        list of repos to be checked
+    repos_to_be_checked: <set>
+        repos to be checked
     devices: <list>
         list of device details to be checked
     manifests: <dict>
         device manifests details
+    yocto_versions: <list>
+        Yocto versions detected in the manifests, each one adds a "_<version>" branch variant
+    variants: <list>
+        branch variants of the current comparison
+    bulk_check: <bool>
+        flag to check a whole page of changes with chunked change queries
+    bulk_chunk_size: <int>
+        number of change ids per query of the bulk check
+    push_down_window: <bool>
+        flag to let Gerrit filter the changes by the date window
+    window_operators: <tuple>
+        Gerrit query operators of the window start and end, switched to
+        fallback_window_operators when Gerrit rejects them
+    fallback_window_operators: <tuple>
+        operators of the servers without mergedafter/mergedbefore, ('after', None): the
+        changes updated since the window start, the window is then checked locally
+    fetch_profile: <str>
+        fetch profile of the change pages, see CHANGE_FETCH_PROFILES
+    fetch_stats: <FetchProfileStats>
+        requests and bytes transferred per fetch profile
+    log_index: <GitilesLogIndex>
+        persistent index of the target branch logs, None to walk the logs on every run
+    max_log_pages: <int>
+        maximum number of gitiles log pages walked per project
+    log_walk_margin: <datetime.timedelta>
+        allowance for clock skew below the time boundary of the log walks
+    bound_log_walks: <bool>
+        flag to stop the log walks below the time boundary of log_walk_goal, without
+        it a walk only stops once its pending changes are found or after max_log_pages
+    log_walks: <dict>
+        pages walked and stop reason per target branch and project
+    stats: <RunStats>
+        time per stage, calls per endpoint family and log walk time per project of the run
+    report_format: <str>
+        format of the report file, 'xlsx', 'csv' or 'ndjson'
+    login_gerrit: <function>
+        returns the Gerrit client, gerrit_login by default
+    login_jira: <function>
+        returns the Jira client, the pooled client of jira_pool by default
+    watermarks: <BranchWatermarks>
+        persisted result and watermark of the previous comparisons, None to always
+        compare the whole branches
+    incremental: <bool>
+        flag to continue from the previous comparison of the same branches
+    progress: <Progress>
+        stage and work done of the comparison, polled by the job running it, the
+        classified pages and the missing changes per variant are published to it
 
     Methods
     --------------------------------
@@ -59,30 +150,50 @@ class BranchComparison:
         updates the merge pending list
     check_in_branch(branch)
         checks the missing changes in the given branch
+    check_page_in_branch(branch, commits)
+        checks the missing changes of a page of commits in the given branch
+    get_changes_page(changes_api, offset)
+        gets one page of changes
+    get_variant_page(variant)
+        gets the current page of changes of a branch variant
     all_devices_repos()
         gets all the repos requires for the devices specified
     get_repos(device)
         gets all the repos for the given device
     is_in_range(commit)
         checks the given commit is in the date range or not
+    window_query()
+        gets the Gerrit query operators of the date range
+    changes_api(branch)
+        gets the merged changes query of the given branch
     get_change_ids()
         gets the change ids of the target branch
+    index_project_log(project, branch, pending, boundary)
+        gets the change ids of one project branch through the log index
+    walk_log(project, revision, pending, boundary)
+        walks a gitiles log until the log walk goal is met
     check_implicit_changes()
         checks the implicit changes in the target branch
     compare_branches(barnch1, branch2)
         checks the changes from branch1 to branch2
+    freshness_token(branch1, branch2)
+        gets the newest merged change of the compared branches
+    compare_variant(variant)
+        checks the changes of one branch variant
+    load_watermark(variant)
+        continues the variant from the previous comparison of the same branches
+    recheck_missing(variant)
+        checks again the changes missing at the previous comparison
+    save_watermark(variant)
+        stores the result and the watermark of the variant
+    resolve_parent_issues()
+        replaces the issues of the final data with their parent issues
     generate_report()
         generates the report from final data
     '''
 
     branch1 = ''
     branch2 = ''
-    offset = 0
-    moffset = 0
-    doffset = 0
-    eob = False
-    meob = False
-    deob = False
     commit = {}
     crossed_start = False
     projects_log = {}
@@ -91,7 +202,7 @@ class BranchComparison:
     start_time = None
     end_time = None
     is_dev_specific = False
-    repos_to_be_checked = []
+    repos_to_be_checked = set()
     devices = []
     manifests = None
     exceptional_repos = []
@@ -101,6 +212,22 @@ class BranchComparison:
         'rdk_gerrit': 'https://code.rdkcentral.com'
     }
     current_gerrit = ''
+    bulk_check = True
+    bulk_chunk_size = 50
+    push_down_window = True
+    fetch_profile = 'with-commit-message'
+    log_index = shared_log_index
+    max_log_pages = 50
+    log_walk_margin = timedelta(days=1)
+    bound_log_walks = True
+    window_operators = ('mergedafter', 'mergedbefore')
+    fallback_window_operators = ('after', None)
+    report_format = 'xlsx'
+    login_gerrit = staticmethod(gerrit_login)
+    login_jira = staticmethod(jira_pool.get)
+    watermarks = shared_watermarks
+    incremental = True
+    progress = Progress()
 
     def __init__(self, start_time, end_time, cmd=True, timezone_val='utc'):
         '''
@@ -132,18 +259,26 @@ class BranchComparison:
             for device in all_devices.values():
                 self.devices += device
 
-        self.is_morty = False
-        self.is_dunfell = False
+        self.final_data = {}
+        self.exceptional_repos = []
+        self.repos_to_be_checked = set()
+        self.yocto_versions = []
+        self.variants = []
+        self.log_walks = {}
+        self.fetch_stats = FetchProfileStats()
+        self.stats = RunStats(self.fetch_stats)
 
-    def update_merge_pending_list(self, branch):
+    def update_merge_pending_list(self, branch, commit=None):
         '''
         Updates the merge pending list  
         '''
-        self.stage_1_data.append(copy.deepcopy(self.commit))
-        if self.commit['project'] not in self.projects_log[branch].keys():
-            self.projects_log[branch][self.commit['project']] = []
+        if commit is None:
+            commit = self.commit
+        self.stage_1_data.append(copy.deepcopy(commit))
+        if commit['project'] not in self.projects_log[branch].keys():
+            self.projects_log[branch][commit['project']] = ChangeIdIndex()
         
-    def check_in_branch(self, branch):
+    def check_in_branch(self, branch, commit=None):
         '''
         Checks the availability of the change in the given branch        
 
@@ -151,21 +286,109 @@ class BranchComparison:
         --------------------------------
         branch: <str>
             brach name
+        commit: <dict>
+            commit to be checked, the commit buffer by default
         '''
+        if commit is None:
+            commit = self.commit
         try:
-            response = self.gerrit.get('/changes/'+self.commit['urlencoded_project']+'~'+branch+'~'+self.commit['change_id']+'/in')
+            response = self.gerrit.get('/changes/'+commit['urlencoded_project']+'~'+branch+'~'+commit['change_id']+'/in')
             if not response['branches']:
                 print('Fix is NOT available in %s\n' % branch)
-                self.update_merge_pending_list(branch)
+                self.update_merge_pending_list(branch, commit)
             elif branch not in response['branches']:
                 print('\nFix is NOT available in ' + branch)
-                self.update_merge_pending_list(branch)
+                self.update_merge_pending_list(branch, commit)
             else:
                 print('Fix is available in %s\n' % branch)
 
         except requests.exceptions.HTTPError:
             print('Fix is NOT available in %s\n' % branch)
-            self.update_merge_pending_list(branch)
+            self.update_merge_pending_list(branch, commit)
+
+    def check_page_in_branch(self, branch, commits):
+        '''
+        Checks the availability of a page of changes in the given branch, the change ids
+        are queried in OR-chunks of bulk_chunk_size instead of one request per change
+
+        Parameters
+        --------------------------------
+        branch: <str>
+            brach name
+        commits: <list>
+            commits to be checked
+        '''
+        change_ids = sorted(set(commit['change_id'] for commit in commits))
+        chunks = [change_ids[index:index + self.bulk_chunk_size]
+                  for index in range(0, len(change_ids), self.bulk_chunk_size)]
+        queries = ['/changes/?q=branch:%s+status:merged+(%s)&n=%s&S=' % (
+            branch, '+OR+'.join('change:' + change_id for change_id in chunk), len(chunk) * 2)
+            for chunk in chunks]
+        merged = set()
+        checked = set()
+        for chunk, query in zip(chunks, queries):
+            offset = 0
+            try:
+                while True:
+                    changes = self.gerrit.get(query + str(offset), fetch_profile='minimal')
+                    for change in changes:
+                        merged.add((change['project'], change['change_id']))
+                    if not changes or not changes[-1].get('_more_changes'):
+                        break
+                    offset += len(changes)
+            except requests.exceptions.HTTPError as e:
+                print('Bulk check failed, checking the changes one by one: %s' % e)
+                checked.update(chunk)
+                for commit in commits:
+                    if commit['change_id'] in chunk:
+                        self.check_in_branch(branch, commit)
+
+        for commit in commits:
+            if commit['change_id'] in checked:
+                continue
+            if (commit['project'], commit['change_id']) in merged:
+                print('Fix is available in %s\n' % branch)
+            else:
+                print('Fix is NOT available in %s\n' % branch)
+                self.update_merge_pending_list(branch, commit)
+
+    def get_changes_page(self, changes_api, offset):
+        '''
+        Gets one page of changes
+
+        Parameters
+        --------------------------------
+        changes_api: <str>
+            changes query ending with the offset parameter
+        offset: <int>
+            offset of the page
+        '''
+        return self.gerrit.get(changes_api + str(offset), fetch_profile=self.fetch_profile)
+
+    def get_variant_page(self, variant):
+        '''
+        Gets the current page of merged changes of the variant source branch. When Gerrit
+        rejects the window operators, the fallback operators are used from then on and the
+        window is checked locally
+
+        Parameters
+        --------------------------------
+        variant: <BranchVariant>
+            branch variant being paged through
+        '''
+        window_operators = self.window_operators
+        try:
+            return self.get_changes_page(self.changes_api(variant.source, variant.since), variant.offset)
+        except requests.exceptions.HTTPError as e:
+            response = e.response
+            if window_operators == self.fallback_window_operators or response is None \
+                    or response.status_code != 400 \
+                    or not any(operator in response.text for operator in window_operators if operator):
+                raise
+            print('Gerrit rejected the %s operators, filtering the date range locally: %s'
+                  % ('/'.join(operator for operator in window_operators if operator), response.text.strip()))
+            self.window_operators = self.fallback_window_operators
+        return self.get_changes_page(self.changes_api(variant.source, variant.since), variant.offset)
 
     def all_devices_repos(self):
         '''
@@ -198,29 +421,20 @@ class BranchComparison:
                 #manifest = json.loads(manifest_content)
                 projects = self.get_deps_content(manifest_content)
                 for project in projects:
-                    if project not in self.repos_to_be_checked:
-                        self.repos_to_be_checked.append(project)
+                    self.repos_to_be_checked.add(project)
             else:
                 manifest = xmltodict.parse(manifest_content)
-                if self.is_morty is False or self.is_dunfell is False:
-                    try:
-                        yv = manifest['manifest'].get('yocto')
-                        print(yv,'****************', device, self.manifests[device]['manifest_file'])
-                        if yv:
-                            if yv['@version'] == 'morty':
-                                self.is_morty = True
-                                print('Is morty True')
-                            elif yv['@version'] == 'dunfell':
-                                self.is_dunfell = True
-                                print('Is dunfell True')
-                            else:
-                                print('!!!!!!!!!!!!!!!!!!!!!!!1111111', yv['@version'])
-                    except Exception as e:
-                        print('Exception while getting yacto version', e)
+                try:
+                    yv = manifest['manifest'].get('yocto')
+                    print(yv,'****************', device, self.manifests[device]['manifest_file'])
+                    if yv and yv['@version'] not in self.yocto_versions:
+                        self.yocto_versions.append(yv['@version'])
+                        print('Yocto version %s detected' % yv['@version'])
+                except Exception as e:
+                    print('Exception while getting yacto version', e)
 
                 for project in manifest['manifest']['project']:
-                    if project['@name'] not in self.repos_to_be_checked:
-                        self.repos_to_be_checked.append(project['@name'])
+                    self.repos_to_be_checked.add(project['@name'])
             #print('************Repos to be checked ***************', self.repos_to_be_checked)
         except Exception as e:
             print(e)
@@ -248,7 +462,7 @@ class BranchComparison:
 
         return projects
 
-    def is_in_range(self, commit):
+    def is_in_range(self, commit, variant=None):
         '''
         Checks the given commit is in the date range or not       
 
@@ -256,6 +470,8 @@ class BranchComparison:
         --------------------------------
         commit: <dict>
             commit details to be checked
+        variant: <BranchVariant>
+            branch variant flagged when the commit is older than the range
         '''
         if (not self.start_time) and (not self.end_time):
             return True
@@ -276,60 +492,287 @@ class BranchComparison:
                 merge_time = merge_time.astimezone(timezone('US/Pacific'))
 
         if updated_time < self.start_time:
-            self.crossed_start = True
+            (variant or self).crossed_start = True
             return False
         if merge_time >= self.start_time and merge_time <= self.end_time:
             return True
         return False
 
+    @staticmethod
+    def log_change_ids(logs):
+        '''
+        Returns the change ids found in the commit messages of a gitiles log page
+        '''
+        change_ids = []
+        for log in logs['log']:
+            start = log['message'].find('Change-Id: ')
+            while start != -1:
+                end = log['message'].find('\n', start + 1)
+                change_ids.append(log['message'][start + 11: end])
+                start = log['message'].find('Change-Id: ', start+1)
+        return change_ids
+
+    @staticmethod
+    def to_utc(value):
+        '''
+        Converts the given date time to an aware UTC date time, naive ones are UTC already
+        '''
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone('UTC'))
+        return value.astimezone(timezone('UTC'))
+
+    @staticmethod
+    def gitiles_time(value):
+        return datetime.strptime(value, '%a %b %d %H:%M:%S %Y %z')
+
+    def log_walk_goal(self, branch2):
+        '''
+        Gets the change ids still pending per project in the target branch and the time
+        boundary of the log walks, None when bound_log_walks is off. A change merged in the
+        target branch before it was cherry-picked to the source one has an older target
+        commit than the source commit, but both keep the author date. So the walks stop
+        below the oldest author date of the pending changes, or the comparison start,
+        minus log_walk_margin. A target commit authored again with the same Change-Id
+        before that date is not found, turn bound_log_walks off for such branches.
+        '''
+        pending = {}
+        boundary = self.to_utc(self.start_time) if self.start_time else None
+        for commit in self.stage_1_data:
+            if commit['branch'] != branch2:
+                continue
+            pending.setdefault(commit['project'], set()).add(commit['change_id'])
+            # the changes missing at a previous comparison were stored without author date
+            author_date = commit.get('author_date') or commit['commit_date']
+            author_time = self.to_utc(datetime.strptime(author_date.split('.')[0], '%Y-%m-%d %H:%M:%S'))
+            if boundary is None or author_time < boundary:
+                boundary = author_time
+        if boundary is None or not self.bound_log_walks:
+            return pending, None
+        return pending, boundary - self.log_walk_margin
+
+    def log_walk_stop_reason(self, logs, found, pending, boundary):
+        '''
+        Gets the reason to stop a log walk after the given page, None to walk on
+
+        Parameters
+        --------------------------------
+        logs: <dict>
+            gitiles log page
+        found: <set>
+            change ids walked so far
+        pending: <set>
+            change ids looked for, None to walk to the end of the log
+        boundary: <datetime.datetime>
+            commits older than it are not needed
+        '''
+        if pending is not None and pending <= found:
+            return 'found_all_pending'
+        if boundary is not None and logs['log'] and \
+                self.gitiles_time(logs['log'][-1]['committer']['time']) < boundary:
+            return 'older_than_start'
+        if 'next' not in logs.keys():
+            return 'end_of_log'
+        return None
+
+    def record_log_walk(self, branch, project, pages, reason):
+        self.log_walks.setdefault(branch, {})[project] = {'pages': pages, 'stop_reason': reason}
+        self.progress.advance()
+        print('Log walk of %s (%s): %s page(s), %s' % (project, branch, pages, reason))
+
+    def walk_log(self, project, revision, pending=None, boundary=None, found=()):
+        '''
+        Walks the gitiles log of the given revision or range until the log walk goal is met,
+        at most max_log_pages pages
+
+        Parameters
+        --------------------------------
+        project: <str>
+            project name
+        revision: <str>
+            revision or range of the log
+        pending: <set>
+            change ids looked for, None to walk to the end of the log
+        boundary: <datetime.datetime>
+            commits older than it are not needed
+        found: <iterable>
+            change ids already known to be in the log
+        '''
+        walk = {'change_ids': [], 'parents': set(), 'tail': None, 'tail_time': None, 'pages': 0,
+                'reason': 'page_limit'}
+        found = set(found)
+        next = ''
+        while walk['pages'] < self.max_log_pages:
+            logs = self.gerrit.get('/plugins/gitiles/' + project + '/+log/' + revision + next)
+            walk['pages'] += 1
+            change_ids = self.log_change_ids(logs)
+            walk['change_ids'] += change_ids
+            found.update(change_ids)
+            for log in logs['log']:
+                walk['parents'].update(log.get('parents', []))
+            if logs['log']:
+                walk['tail_time'] = logs['log'][-1]['committer']['time']
+            walk['tail'] = logs.get('next')
+            reason = self.log_walk_stop_reason(logs, found, pending, boundary)
+            if reason:
+                walk['reason'] = reason
+                break
+            next = '/?s=' + logs['next']
+        return walk
+
+    def get_change_ids_indexed(self, branch2, pending, boundary):
+        '''
+        Gets the change ids of the target branch through the log index
+        '''
+        projects = list(self.projects_log[branch2].keys())
+        results = [self.stats.timed_project(project, self.index_project_log, project, branch2,
+                                            pending.get(project), boundary)
+                   for project in projects]
+        for project, change_ids in zip(projects, results):
+            if change_ids is None:
+                self.exceptional_repos.append(project)
+            else:
+                self.projects_log[branch2][project].update(change_ids)
+
+    def index_project_log(self, project, branch, pending, boundary):
+        '''
+        Gets the change ids of the project branch from the log index. Only the commits
+        above the indexed head are fetched, the index is rebuilt when the branch was not
+        fast-forwarded and the indexed log is walked further back while pending changes
+        are not found in it. Returns None when the branch does not exist in the project.
+
+        Parameters
+        --------------------------------
+        project: <str>
+            project name
+        branch: <str>
+            branch name
+        pending: <set>
+            change ids looked for
+        boundary: <datetime.datetime>
+            commits older than it are not needed
+        '''
+        entry = self.log_index.get(self.current_gerrit, project, branch)
+        pages = 0
+        reason = 'indexed'
+        if entry and entry['fresh']:
+            head = entry['head']
+        else:
+            try:
+                head = self.gerrit.get('/projects/%s/branches/%s' % (project.replace('/', '%2F'), branch))['revision']
+            except requests.exceptions.HTTPError:
+                return None
+        if entry and entry['head'] == head:
+            if not entry['fresh']:
+                self.log_index.touch(self.current_gerrit, project, branch)
+        elif entry:
+            try:
+                walk = self.walk_log(project, '%s..%s' % (entry['head'], head))
+                pages += walk['pages']
+                if walk['tail'] is None and entry['head'] in walk['parents']:
+                    entry['change_ids'] = walk['change_ids'] + entry['change_ids']
+                    entry['head'] = head
+                else:
+                    entry = None
+            except requests.exceptions.HTTPError:
+                entry = None
+            if entry is None:
+                print('%s is not a fast-forward of the indexed %s log, rebuilding the index' % (head, project))
+            else:
+                self.log_index.put(self.current_gerrit, project, branch, head, entry['tail'],
+                                   entry['tail_time'], entry['change_ids'])
+        if entry is None:
+            try:
+                walk = self.walk_log(project, head, pending, boundary)
+            except requests.exceptions.HTTPError:
+                return None
+            pages += walk['pages']
+            reason = walk['reason']
+            entry = {'head': head, 'tail': walk['tail'], 'tail_time': walk['tail_time'],
+                     'change_ids': walk['change_ids']}
+            self.log_index.put(self.current_gerrit, project, branch, head, entry['tail'],
+                               entry['tail_time'], entry['change_ids'])
+            self.record_log_walk(branch, project, pages, reason)
+            return entry['change_ids']
+
+        missing = (pending or set()) - set(entry['change_ids'])
+        if missing and entry['tail'] and not (boundary and entry['tail_time'] and
+                                              self.gitiles_time(entry['tail_time']) < boundary):
+            try:
+                walk = self.walk_log(project, entry['tail'], missing, boundary)
+            except requests.exceptions.HTTPError:
+                walk = None
+            if walk is not None:
+                pages += walk['pages']
+                reason = walk['reason']
+                entry['change_ids'] += walk['change_ids']
+                self.log_index.put(self.current_gerrit, project, branch, head, walk['tail'],
+                                   walk['tail_time'], entry['change_ids'])
+        self.record_log_walk(branch, project, pages, reason)
+        return entry['change_ids']
+
+    @staticmethod
+    def to_gerrit_time(value):
+        '''
+        Formats the given date time as a quoted UTC Gerrit query timestamp
+        '''
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone('UTC'))
+        return quote('"%s +0000"' % value.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def window_query(self):
+        '''
+        Gets the Gerrit query operators of the date range so that only the changes merged
+        in the range are returned, empty without a date range
+        '''
+        if not self.push_down_window or not self.start_time or not self.end_time:
+            return ''
+        after_operator, before_operator = self.window_operators
+        query = '+%s:%s' % (after_operator, self.to_gerrit_time(self.start_time))
+        if before_operator:
+            # the range end is inclusive while Gerrit compares the merge time with milliseconds
+            query += '+%s:%s' % (before_operator, self.to_gerrit_time(self.end_time + timedelta(seconds=1)))
+        return query
+
+    def is_window_in_query(self):
+        return self.window_query() != '' and self.window_operators[1] is not None
+
+    def changes_api(self, branch, since=None):
+        '''
+        Gets the merged changes query of the given branch ending with the offset parameter,
+        limited to the changes merged since the given watermark
+        '''
+        since_query = ''
+        if since and self.push_down_window:
+            since_query = '+%s:%s' % (self.window_operators[0], self.to_gerrit_time(since))
+        return '/changes/?q=branch:%s+status:merged%s%s%s&n=100&S=' % (
+            branch, self.window_query(), since_query, fetch_options(self.fetch_profile))
+
     def get_change_ids(self, branch2):
         '''
-        Gets all the change ids of the target branch  
+        Gets the change ids of the target branch, the log of each project is walked
+        until the changes still pending for it are found or the commits get older than
+        needed, see log_walk_goal
         '''
-        total_iteration = 10
-        total_length = len(self.projects_log[branch2].keys()) * total_iteration
-        current_count = 0
-        #printProgressBar (current_count, total_length, prefix = 'Checking implicit changes', suffix = '', decimals = 1, length = 100, fill = '||')
+        pending, boundary = self.log_walk_goal(branch2)
+        if self.log_index is not None:
+            return self.get_change_ids_indexed(branch2, pending, boundary)
         for project in self.projects_log[branch2].keys():
-            iteration_count = 0
-
-            log_api_template = '/plugins/gitiles/' + project + '/+log/' + branch2
-            next = ''
-            while iteration_count < total_iteration:
-                iteration_count += 1
-                current_count += 1
-                log_api = log_api_template + next
-                try:
-                    logs = self.gerrit.get(log_api)
-                except requests.exceptions.HTTPError:
-                    mod = current_count // total_iteration
-                    rem = current_count % total_iteration
-                    current_count = (mod + 1) * total_iteration
-                    #printProgressBar (current_count, total_length, prefix = 'Checking implicit changes', suffix = '', decimals = 1, length = 100, fill = '||')
-                    self.exceptional_repos.append(project)
-                    break
-                for log in logs['log']:
-                    start = log['message'].find('Change-Id: ')
-                    while start != -1:
-                        end = log['message'].find('\n', start + 1)
-                        self.projects_log[branch2][project].append(log['message'][start + 11: end])
-                        start = log['message'].find('Change-Id: ', start+1)
-                #printProgressBar (current_count, total_length, prefix = 'Checking implicit changes', suffix = '', decimals = 1, length = 100, fill = '||')
-                if 'next' not in logs.keys():
-                    mod = current_count // total_iteration
-                    rem = current_count % total_iteration
-                    if rem != 0:
-                        current_count = (mod + 1) * total_iteration
-                        #printProgressBar (current_count, total_length, prefix = 'Checking implicit changes', suffix = '', decimals = 1, length = 100, fill = '||')
-                    break
-                next = '/?s=' + logs['next']
+            try:
+                walk = self.stats.timed_project(project, self.walk_log, project, branch2, pending.get(project), boundary)
+            except requests.exceptions.HTTPError:
+                self.exceptional_repos.append(project)
+                continue
+            self.projects_log[branch2][project].update(walk['change_ids'])
+            self.record_log_walk(branch2, project, walk['pages'], walk['reason'])
 
     def check_implicit_changes(self, branch2):
         '''
         Checks the implicit changes in the target branch with the misiing changes 
         '''
         if len(self.stage_1_data) > 0:
-            self.get_change_ids(branch2)
+            self.progress.stage('log walks ' + branch2, len(self.projects_log[branch2]))
+            with self.stats.timer('log walks'):
+                self.get_change_ids(branch2)
         for commit in self.stage_1_data:
             if commit['branch'] == branch2 and commit['change_id'] not in self.projects_log[branch2][commit['project']]:
                 if commit['subject'].startswith('Revert'):
@@ -349,6 +792,15 @@ class BranchComparison:
         self.final_data[self.current_gerrit]['changes'] = sorted(
             self.final_data[self.current_gerrit]['changes'], key = lambda x: x['merge_time'])
 
+    def resolve_parent_issues(self):
+        '''
+        Replaces the issues of the final data with their parent issues
+        '''
+        changes = [change for gerrit in self.final_data.values() for change in gerrit['changes']]
+        self.progress.stage('jira', len(changes))
+        with self.stats.timer('jira'):
+            resolve_parent_issues(changes, get_jira=lambda: self.stats.jira(self.login_jira()))
+
     def compare_branches(self, branch1, branch2, primary_gerrit=None, rdk_gerrit=None):
         '''
         Compares the given source and target branch and returns the final data      
@@ -362,7 +814,6 @@ class BranchComparison:
         '''
         self.branch1 = branch1
         self.branch2 = branch2
-        self.jira=jira_login()
         #print(self.gerrits, '*********Gerrits*******')
         for gerrit in self.gerrits:
             self.current_gerrit = gerrit
@@ -370,344 +821,283 @@ class BranchComparison:
             self.final_data[gerrit] = {
                 'changes': []
             }
-            if self.cmd is False:
-                if self.current_gerrit == 'primary_gerrit':
-                    self.gerrit = gerrit_login(self.current_gerrit, primary_gerrit)
-                else:
-                    self.gerrit = gerrit_login(self.current_gerrit, rdk_gerrit)
-            else:
-                self.gerrit = gerrit_login(self.current_gerrit)
+            self.progress.stage('login')
+            self.gerrit = self.gerrit_client(gerrit, primary_gerrit, rdk_gerrit)
             if self.current_gerrit == 'primary_gerrit' and self.is_dev_specific:
-                self.all_devices_repos()
-            if self.branch2:
-                self.projects_log = {branch2:{}}
-            else:
-                self.projects_log = {branch1: {}}
-            self.crossed_start = False
+                self.progress.stage('manifests')
+                with self.stats.timer('manifests'):
+                    self.all_devices_repos()
+            self.variants = self.branch_variants()
+            self.projects_log = {variant.branch: {} for variant in self.variants}
             self.stage_1_data = []
-            self.offset = 0
-            while(1):
-                try:
-                    commit_details = self.gerrit.get('/changes/?q=branch:'+self.branch1+'+status:merged\
-        &o=CURRENT_REVISION&o=CURRENT_COMMIT&o=MESSAGES&n=100&S='+str(self.offset))
-                    no_commits = False
-                    if not commit_details:
-                        no_commits = True
-                    commit_details = [commit for commit in commit_details if (not self.crossed_start) and self.is_in_range(commit)]
-                except requests.exceptions.SSLError as e:
-                    commit_details = []
-                    print('------------SSL Error------------------------------')
-                    #print(e)
-                    no_commits = True
-                    break
-                for i in range(len(commit_details)):
-                    try:                    
-                        #('\n\n###', self.offset+i+1, ' ###')
-                        if self.is_dev_specific and commit_details[i]['project'] not in self.repos_to_be_checked:
-                            print('Skipping commit for the project: ' + commit_details[i]['project'])
-                            continue
-                        self.commit['change_id'] = commit_details[i]['change_id']
-                        self.commit['project'] = commit_details[i]['project']
-                        self.commit['subject'] = commit_details[i]['subject']
-                        self.commit['urlencoded_project'] = commit_details[i]['project'].replace('/','%2f')
-                        self.commit['current_revision'] = commit_details[i]['current_revision']
-                        self.commit['commit_msg'] = commit_details[i]['revisions'][self.commit['current_revision']]['commit']['message']
-                        #print(self.commit['commit_msg'])
-                        issue=re.findall(r'\w+-\d+', self.commit['commit_msg'])
-                        
-                        for each in issue:
-                            try:
-                                result=self.jira.issue(each)
-                                try:
-                                    parent=result.fields.parent.key
-                                    index=issue.index(each)
-                                    issue[index]=parent
-                                except :
-                                    pass
-                            except:
-                                pass
-
-                        
-                        self.commit['issues']=list(set(issue))
-                        self.commit['merge_time'] = datetime.strptime(commit_details[i]['submitted'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                        if self.branch2:
-                            self.commit['branch'] = branch2
-                            self.check_in_branch(self.branch2)
-                        else:
-                            self.commit['branch'] = branch1
-                            self.stage_1_data.append(copy.deepcopy(self.commit))
-                    except IndexError:
-                        self.eob = True
-                        break
-                if self.eob or no_commits or self.crossed_start:
-                    print('Reached End Of Branch')
-                    break
-                else:
-                    self.offset += 100
-            if self.is_morty:
-                if branch2:
-                    branch_str = '%s_morty'%(branch2)
-                else:
-                    branch_str = '%s_morty' % (branch1)
-                self.crossed_start = False
-                self.projects_log[branch_str] = {}
-                while (1):
-                    try:
-                        mcommit_details = self.gerrit.get('/changes/?q=branch:' + self.branch1 + '_morty+status:merged\
-                        &o=CURRENT_REVISION&o=CURRENT_COMMIT&o=MESSAGES&n=100&S=' + str(self.moffset))
-                        mno_commits = False
-                        if not mcommit_details:
-                            mno_commits = True
-                        mcommit_details = [commit for commit in mcommit_details if
-                                          (not self.crossed_start) and self.is_in_range(commit)]
-                    except requests.exceptions.SSLError as e:
-                        mcommit_details = []
-                        print('------------SSL Error------------------------------')
-                        # print(e)
-                        mno_commits = True
-                        break
-                    for i in range(len(mcommit_details)):
-                        try:
-                            # if self.is_dev_specific and mcommit_details[i]['project'] not in self.repos_to_be_checked:
-                            #     print('Skipping commit for the project: ' + commit_details[i]['project'])
-                            #     continue
-                            self.commit['change_id'] = mcommit_details[i]['change_id']
-                            self.commit['project'] = mcommit_details[i]['project']
-                            self.commit['subject'] = mcommit_details[i]['subject']
-                            self.commit['urlencoded_project'] = mcommit_details[i]['project'].replace('/', '%2f')
-                            self.commit['current_revision'] = mcommit_details[i]['current_revision']
-                            self.commit['commit_msg'] = \
-                            mcommit_details[i]['revisions'][self.commit['current_revision']]['commit']['message']
-                            # print(self.commit['commit_msg'])
-                            issue=re.findall(r'\w+-\d+', self.commit['commit_msg'])
-                            for each in issue:
-                                try:
-                                    result=self.jira.issue(each)
-                                    try:
-                                        parent=result.fields.parent.key
-                                        index=issue.index(each)
-                                        issue[index]=parent
-                                    except :
-                                        pass
-                                except:
-                                    pass
-                            self.commit['issues']=list(set(issue))
-                            # print(self.commit['issues'])
-                            self.commit['merge_time'] = datetime.strptime(mcommit_details[i]['submitted'].split('.')[0],
-                                                                          '%Y-%m-%d %H:%M:%S')
-                            self.commit['branch'] = branch_str
-                            if self.branch2:
-                                self.check_in_branch(branch_str)
-                            else:
-                                self.stage_1_data.append(copy.deepcopy(self.commit))
-                        except IndexError:
-                            self.meob = True
-                            break
-                    if self.meob or mno_commits or self.crossed_start:
-                        print('Reached End Of Branch')
-                        break
-                    else:
-                        self.moffset += 100
-            if self.is_dunfell:
-                if branch2:
-                    branch_str = '%s_dunfell'%branch2
-                else:
-                    branch_str = '%s_dunfell' % (branch1)
-                self.projects_log[branch_str] = {}
-                self.crossed_start = False
-                while (1):
-                    try:
-                        dcommit_details = self.gerrit.get('/changes/?q=branch:' + self.branch1 + '_dunfell+status:merged\
-                        &o=CURRENT_REVISION&o=CURRENT_COMMIT&o=MESSAGES&n=100&S=' + str(self.doffset))
-                        dno_commits = False
-                        #print(dcommit_details)
-                        if not dcommit_details:
-                            dno_commits = True
-                        dcommit_details = [commit for commit in dcommit_details if
-                                          (not self.crossed_start) and self.is_in_range(commit)]
-                        print(dcommit_details)
-                    except requests.exceptions.SSLError as e:
-                        mcommit_details = []
-                        print('------------SSL Error------------------------------')
-                        # print(e)
-                        dno_commits = True
-                        break
-                    for i in range(len(dcommit_details)):
-                        try:
-                            # if self.is_dev_specific and mcommit_details[i]['project'] not in self.repos_to_be_checked:
-                            #     print('Skipping commit for the project: ' + commit_details[i]['project'])
-                            #     continue
-                            self.commit['change_id'] = dcommit_details[i]['change_id']
-                            self.commit['project'] = dcommit_details[i]['project']
-                            self.commit['subject'] = dcommit_details[i]['subject']
-                            self.commit['urlencoded_project'] = dcommit_details[i]['project'].replace('/', '%2f')
-                            self.commit['current_revision'] = dcommit_details[i]['current_revision']
-                            self.commit['commit_msg'] = \
-                            dcommit_details[i]['revisions'][self.commit['current_revision']]['commit']['message']
-                            # print(self.commit['commit_msg'])
-                            
-                            for each in issue:
-                                try:
-                                    result=self.jira.issue(each)
-                                    try:
-                                        parent=result.fields.parent.key
-                                        index=issue.index(each)
-                                        issue[index]=parent
-                                    except :
-                                        pass
-                                except:
-                                    pass
-                            self.commit['issues']=list(set(issue))
-                            self.commit['merge_time'] = datetime.strptime(dcommit_details[i]['submitted'].split('.')[0],
-                                                                          '%Y-%m-%d %H:%M:%S')
-                            self.commit['branch'] = branch_str
-                            if self.branch2:
-                                self.check_in_branch(branch_str)
-                            else:
-                                self.stage_1_data.append(copy.deepcopy(self.commit))
-                        except IndexError:
-                            self.deob = True
-                            break
-                    if self.deob or dno_commits or self.crossed_start:
-                        print('Reached End Of Branch')
-                        break
-                    else:
-                        self.doffset += 100
             if self.branch2:
-                self.check_implicit_changes(self.branch2)
-                if self.is_morty:
-                    self.check_implicit_changes('%s_morty'%self.branch2)
-                if self.is_dunfell:
-                    self.check_implicit_changes('%s_dunfell'%self.branch2)
+                for variant in self.variants:
+                    self.load_watermark(variant)
+            self.progress.stage('changes')
+            self.compare_variants(self.variants)
+            if self.branch2:
+                for variant in self.variants:
+                    self.check_implicit_changes(variant.branch)
+                    self.save_watermark(variant)
+                    self.publish_missing(variant)
             else:
                 self.add_to_final_data()
+        self.resolve_parent_issues()
+        print('Change fetch profiles: %s' % self.fetch_stats.summary())
         return self.final_data
         # return self.merge_pending
 
-    def write_cell(self, change, sheet, row, change_type, col_width, styles, gerrit):
-        if len(str(change['merge_time'])) > col_width[change_type]['merge_time']:
-            col_width[change_type]['merge_time'] = len(str(change['merge_time']))
-        if len(change['change_id']) > col_width[change_type]['change_id']:
-            col_width[change_type]['change_id'] = len(change['change_id'])
-        joined_issues = ','.join(change['issues'])
-        if len(change['project']) > col_width[change_type]['project']:
-            col_width[change_type]['project'] = len(change['project'])
-        if len(joined_issues) > col_width[change_type]['issues']:
-            col_width[change_type]['issues'] = len(joined_issues)
-        if change['is_revert']:
-            style = 'revert'
+    def gerrit_client(self, gerrit, primary_gerrit=None, rdk_gerrit=None):
+        '''
+        Logs into the given gerrit with the credentials of the request, the configured ones
+        on the command line
+        '''
+        with self.stats.timer('login'):
+            if self.cmd is False:
+                creds = primary_gerrit if gerrit == 'primary_gerrit' else rdk_gerrit
+                return self.stats.instrument(self.login_gerrit(gerrit, creds))
+            return self.stats.instrument(self.login_gerrit(gerrit))
+
+    def freshness_token(self, branch1, branch2, primary_gerrit=None, rdk_gerrit=None):
+        '''
+        Gets the newest merged change of the compared branches and of their variants on
+        every gerrit, any new merge changes the token and so the report cache key
+        '''
+        branches = '+OR+'.join('branch:' + quote('^%s.*' % branch, safe='') for branch in [branch1, branch2] if branch)
+        token = {}
+        for gerrit in self.gerrits:
+            changes = self.gerrit_client(gerrit, primary_gerrit, rdk_gerrit).get(
+                '/changes/?q=(%s)+status:merged&n=1' % branches)
+            token[gerrit] = '%s@%s' % (changes[0]['_number'], changes[0]['updated']) if changes else None
+        return token
+
+    def branch_variants(self):
+        '''
+        Gets the main branch and one variant per Yocto version detected in the manifests
+        '''
+        return [BranchVariant(suffix, self.branch1, self.branch2)
+                for suffix in [''] + ['_' + version for version in self.yocto_versions]]
+
+    def compare_variants(self, variants):
+        '''
+        Compares all the given branch variants concurrently
+        '''
+        if len(variants) == 1:
+            self.compare_variant(variants[0])
+            return
+        with ThreadPoolExecutor(max_workers=len(variants)) as executor:
+            list(executor.map(self.compare_variant, variants))
+
+    def compare_variant(self, variant):
+        '''
+        Pages through the merged changes of the variant source branch and checks them
+        in the variant target branch
+
+        Parameters
+        --------------------------------
+        variant: <BranchVariant>
+            branch variant to be compared
+        '''
+        while True:
+            page_commits = []
+            pending = len(self.stage_1_data)
+            try:
+                with self.stats.timer('paging'):
+                    commit_details = self.get_variant_page(variant)
+                no_commits = False
+                if not commit_details or not commit_details[-1].get('_more_changes'):
+                    no_commits = True
+                if not self.is_window_in_query():
+                    commit_details = [commit for commit in commit_details
+                                      if (not variant.crossed_start) and self.is_in_range(commit, variant)]
+                if variant.since:
+                    commit_details = self.merged_since(commit_details, variant)
+            except requests.exceptions.SSLError as e:
+                print('------------SSL Error------------------------------')
+                variant.complete = False
+                break
+            for change in commit_details:
+                merge_time = self.gerrit_datetime(change['submitted'])
+                variant.newest = max(variant.newest or merge_time, merge_time)
+                variant.seen.add((change['project'], change['change_id']))
+                # Yocto variants are not listed in the manifests of the main branch
+                if not variant.suffix and self.is_dev_specific and change['project'] not in self.repos_to_be_checked:
+                    print('Skipping commit for the project: ' + change['project'])
+                    continue
+                commit = self.commit_from_change(change, variant.branch)
+                if self.branch2:
+                    if self.bulk_check:
+                        page_commits.append(commit)
+                    else:
+                        with self.stats.timer('check_in_branch'):
+                            self.check_in_branch(variant.branch, commit)
+                else:
+                    self.stage_1_data.append(commit)
+            if page_commits:
+                with self.stats.timer('check_in_branch'):
+                    self.check_page_in_branch(variant.branch, page_commits)
+            self.progress.advance(len(commit_details))
+            self.progress.publish('page', {
+                'gerrit': self.current_gerrit,
+                'branch': variant.branch,
+                'offset': variant.offset,
+                'checked': len(commit_details),
+                'pending': [commit for commit in self.stage_1_data[pending:] if commit['branch'] == variant.branch]
+            })
+            if no_commits or variant.crossed_start:
+                print('Reached End Of Branch %s' % variant.source)
+                break
+            variant.offset += 100
+        if self.branch2 and variant.previous_missing:
+            with self.stats.timer('check_in_branch'):
+                self.recheck_missing(variant)
+
+    @staticmethod
+    def gerrit_datetime(value):
+        return datetime.strptime(value.split('.')[0], '%Y-%m-%d %H:%M:%S')
+
+    def merged_since(self, changes, variant):
+        '''
+        Keeps the changes merged at or after the watermark of the variant, the changes
+        come newest updated first so the paging stops at the first one updated before it
+        '''
+        recent = []
+        for change in changes:
+            if self.gerrit_datetime(change['updated']) < variant.since:
+                variant.crossed_start = True
+                break
+            if self.gerrit_datetime(change['submitted']) >= variant.since:
+                recent.append(change)
+        return recent
+
+    def watermark_key(self, variant):
+        '''
+        Gets the key of the comparison state of the variant, every value which changes the
+        compared changes is part of it
+        '''
+        return self.watermarks.key({
+            'gerrit': self.gerrit.url,
+            'user': getattr(getattr(self.gerrit, 'auth', None), 'username', None),
+            'source': variant.source,
+            'target': variant.branch,
+            'start': self.start_time,
+            'repos': sorted(self.repos_to_be_checked) if self.is_dev_specific and not variant.suffix else None
+        })
+
+    def window_end(self):
+        return self.to_utc(self.end_time).timestamp() if self.end_time else None
+
+    def load_watermark(self, variant):
+        '''
+        Continues the variant from the previous comparison of the same branches, unless
+        the window now ends before the previous one
+        '''
+        if self.watermarks is None or not self.incremental:
+            return
+        state = self.watermarks.get(self.watermark_key(variant))
+        if state is None or (state['end'] is not None and self.window_end() < state['end']):
+            return
+        variant.since = state['watermark']
+        variant.newest = state['watermark']
+        variant.previous_missing = state['missing']
+        print('Comparing %s from %s, %s changes missing previously'
+              % (variant.source, variant.since, len(variant.previous_missing)))
+
+    def recheck_missing(self, variant):
+        '''
+        Checks again in the target branch the changes missing at the previous comparison
+        which were not fetched again
+        '''
+        commits = [commit for commit in variant.previous_missing
+                   if (commit['project'], commit['change_id']) not in variant.seen
+                   and (variant.suffix or not self.is_dev_specific or commit['project'] in self.repos_to_be_checked)]
+        if self.bulk_check:
+            for index in range(0, len(commits), 100):
+                self.check_page_in_branch(variant.branch, commits[index:index + 100])
         else:
-            style = 'normal'
-        # sheet.write(row, 0, change['merge_time'], styles[style]['style_bg'])
-        sheet.write(row, 0, str(
-            datetime.strptime(change['merge_time'], '%Y-%m-%d %H:%M:%S')+ timedelta(hours=5, minutes=30)),
-                    styles[style]['style_bg'])
-        sheet.write(row, 1, xlwt.Formula(
-            'HYPERLINK("{}","{}")'.format(self.gerrit_urls[gerrit] + '/#/q/' + change['change_id'],
-                                          change['change_id'])), styles[style]['style_link'])
-        sheet.write(row, 2, change['project'], styles[style]['style_center'])
-        sheet.write(row, 3, joined_issues, styles[style]['style_bg'])
-        sheet.write(row, 4, 'YES' if change['is_revert'] else 'NO', styles[style]['style_bg'])
+            for commit in commits:
+                self.check_in_branch(variant.branch, commit)
 
-    def generate_report(self):
+    def publish_missing(self, variant):
         '''
-        Initializes the class instance with the required parameters Generates the final report
-        using the final data fetched
-        '''
-        book = xlwt.Workbook()
-        changes_sheet = book.add_sheet('missing_changes')
-        style_header = xlwt.easyxf('pattern: pattern solid, fore_colour gray40;' 'font: bold True;')
-        styles = {
-            'revert': {
-                'style_bg': xlwt.easyxf('font: colour red;'),
-                'style_center': xlwt.easyxf('alignment: vertical center;' 'font: colour red;'),
-                'style_link': xlwt.easyxf('font: colour red, underline single;')
-            },
-            'normal': {
-                'style_bg': xlwt.easyxf(''),
-                'style_center': xlwt.easyxf('alignment: vertical center;'),
-                'style_link': xlwt.easyxf('font: colour blue, underline single;')
-            }
-        }
-        
+        Publishes the changes of the variant missing in the target branch once its log is checked
+        '''
+        self.progress.publish('missing', {
+            'gerrit': self.current_gerrit,
+            'branch': variant.branch,
+            'changes': [commit for commit in self.final_data[self.current_gerrit]['changes']
+                        if commit['branch'] == variant.branch]
+        })
 
-        col_width = {
-            'changes': {
-                'project': 7,
-                'merge_time': 10,
-                'change_id': 9,
-                'issues': 7,
-                'revert': 6
-            }
+    def save_watermark(self, variant):
+        '''
+        Stores the changes of the variant still missing in the target branch with the
+        watermark, only when every source change was paged through
+        '''
+        if self.watermarks is None or not variant.complete or variant.newest is None:
+            return
+        missing = [commit for commit in self.final_data[self.current_gerrit]['changes']
+                   if commit['branch'] == variant.branch]
+        self.watermarks.put(self.watermark_key(variant), variant.newest, self.window_end(), missing)
+
+    @staticmethod
+    def commit_from_change(change, branch):
+        '''
+        Builds the commit details of the given change
+        '''
+        commit = {
+            'change_id': change['change_id'],
+            'project': change['project'],
+            'subject': change['subject'],
+            'urlencoded_project': change['project'].replace('/', '%2f'),
+            'current_revision': change['current_revision'],
+            'branch': branch
         }
+        commit['commit_msg'] = change['revisions'][commit['current_revision']]['commit']['message']
+        commit['issues'] = list(set(re.findall(r'\w+-\d+', commit['commit_msg'])))
+        commit['commit_date'] = change['revisions'][commit['current_revision']]['commit']['committer']['date']
+        commit['author_date'] = change['revisions'][commit['current_revision']]['commit']['author']['date']
+        commit['merge_time'] = datetime.strptime(change['submitted'].split('.')[0], '%Y-%m-%d %H:%M:%S')
+        return commit
 
-        changes_sheet.write(0, 0, 'Merge Time (IST)', style_header)        
-        changes_sheet.write(0, 1, 'Change Id', style_header)
-        changes_sheet.write(0, 2, 'Project', style_header)
-        changes_sheet.write(0, 3, 'Issues', style_header)
-        changes_sheet.write(0, 4, 'Revert', style_header)
+    def write_cell(self, writer, change, gerrit, section=None):
+        merge_time = str(datetime.strptime(change['merge_time'], '%Y-%m-%d %H:%M:%S') + timedelta(hours=5, minutes=30))
+        writer.write_change(self.gerrit_urls[gerrit], change, merge_time, section)
 
-        gerrit_switch = False
-        row = 1
-        sheet = changes_sheet
-        change_type = 'changes'
-
-        for gerrit in self.final_data.keys():
-            morty_changes = []
-            dunfell_changes = []
-            if gerrit_switch:
-                sheet.write(row, 0, '')
-                sheet.write(row, 1, '')
-                sheet.write(row, 2, '')
-                sheet.write(row, 3, '')
-                row += 1
-            gerrit_switch = True
-            for change in self.final_data[gerrit][change_type]:
-                if change['branch'].find('_morty') != -1:
-                    morty_changes.append(change)
-                elif change['branch'].find('_dunfell') != -1:
-                    dunfell_changes.append(change)
-                else:
-                    self.write_cell(change, sheet, row, change_type, col_width, styles, gerrit)
-                    row += 1
-
-            if morty_changes:
-                row += 3
-                sheet.write(row, 0, morty_changes[0]['branch'])
-                row += 2
-                for change in morty_changes:
-                    self.write_cell(change, sheet, row, change_type, col_width, styles, gerrit)
-                    row += 1
-
-            if dunfell_changes:
-                row += 3
-                sheet.write(row, 0, dunfell_changes[0]['branch'])
-                row += 2
-                for change in dunfell_changes:
-                    self.write_cell(change, sheet, row, change_type, col_width, styles, gerrit)
-                    row += 1
-
-        for sheet in col_width.keys():
-            for col in col_width[sheet].keys(): col_width[sheet][col] = 254 if col_width[sheet][col] > 254 else col_width[sheet][col]
-
-        changes_sheet.col(0).width = int(col_width['changes']['merge_time'] * 256)
-        changes_sheet.col(1).width = int(col_width['changes']['change_id'] * 256)
-        changes_sheet.col(2).width = int(col_width['changes']['project'] * 256)
-        changes_sheet.col(3).width = int((col_width['changes']['issues'] + 1) * 256)
-        changes_sheet.col(4).width = int(col_width['changes']['revert'] * 256)
-
-        changes_sheet.set_horz_split_pos(1)
-        changes_sheet.set_vert_split_pos(1)
-        changes_sheet.panes_frozen = True
-        changes_sheet.remove_splits = True
+    def generate_report(self):
+        '''
+        Generates the final report using the final data fetched, the rows are streamed
+        to the report file in the report format
+        '''
         if self.branch2:
-            report_file_name = 'reports/' + self.branch1 + '_' + self.branch2 + '_' + 'missing_report_' \
-                               + datetime.now().strftime('%d_%m_%Y_%H_%M_%S') + '.xls'
+            report_name = 'reports/' + self.branch1 + '_' + self.branch2 + '_' + 'missing_report_' \
+                          + datetime.now().strftime('%d_%m_%Y_%H_%M_%S')
         else:
-            report_file_name = 'reports/' + self.branch1 + '_diffreport_' \
-                               + datetime.now().strftime('%d_%m_%Y_%H_%M_%S') + '.xls'
-        book.save(self.BASE_DIR+'/'+report_file_name)
-        return report_file_name
+            report_name = 'reports/' + self.branch1 + '_diffreport_' \
+                          + datetime.now().strftime('%d_%m_%Y_%H_%M_%S')
+
+        header = ['Merge Time (IST)'] + REPORT_COLUMNS[1:]
+        gerrit_switch = False
+        variant_branches = [variant.branch for variant in self.variants if variant.suffix]
+        with report_writer(self.report_format, self.BASE_DIR + '/' + report_name, 'missing_changes',
+                           header) as writer:
+            for gerrit in self.final_data.keys():
+                variant_changes = {branch: [] for branch in variant_branches}
+                if gerrit_switch:
+                    writer.write_blank()
+                gerrit_switch = True
+                for change in self.final_data[gerrit]['changes']:
+                    if change['branch'] in variant_changes:
+                        variant_changes[change['branch']].append(change)
+                    else:
+                        self.write_cell(writer, change, gerrit)
+
+                for branch in variant_branches:
+                    if variant_changes[branch]:
+                        writer.write_section(branch)
+                        for change in variant_changes[branch]:
+                            self.write_cell(writer, change, gerrit, branch)
+        return report_name + '.' + writer.extension
 
 if __name__ == '__main__':
     args_length = len(sys.argv)
@@ -743,4 +1133,5 @@ if __name__ == '__main__':
         branch_comparison.generate_report()
     else:
         print('\n*** No merge pending tickets ***\n')
+    print('Issue parent cache: %s' % parent_cache_stats())
  
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from cache_settings import CACHE_DIR, load_cache_settings
+
+DEFAULTS = {
+    'enabled': True,
+    'path': CACHE_DIR + '/branch_watermarks.sqlite3',
+    'max_age_seconds': 7 * 86400
+}
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class BranchWatermarks:
+    '''
+    Result of the last comparison of each branch variant with its watermark, the merge
+    time of the newest source change seen. A repeated comparison only pages through the
+    changes merged since the watermark and checks again the changes which were missing
+    in the target branch, the changes found there once stay found. A state older than
+    max_age is ignored so that a full comparison runs now and then.
+
+    Attributes
+    --------------------------------
+    path: <str>
+        SQLite database file
+    max_age: <int>
+        seconds a state can be reused
+
+    Methods
+    --------------------------------
+    key(comparison)
+        returns the key of the normalized comparison of one branch variant
+    get(key)
+        returns the watermark, window end and missing commits of the key, None when
+        missing or expired
+    put(key, watermark, end, missing)
+        stores the state of a complete comparison
+    stats()
+        returns the counters of the incremental and full comparisons
+    '''
+
+    def __init__(self, path=DEFAULTS['path'], max_age_seconds=DEFAULTS['max_age_seconds']):
+        self.path = path
+        self.max_age = max_age_seconds
+        self.counters = {'incremental': 0, 'full': 0}
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS branch_watermarks ('
+                                    'state_key TEXT PRIMARY KEY, watermark TEXT NOT NULL, window_end REAL, '
+                                    'missing TEXT NOT NULL, updated_at REAL NOT NULL)')
+            self.connection.commit()
+        return self.connection
+
+    @staticmethod
+    def key(comparison):
+        return hashlib.sha256(json.dumps(comparison, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connect().execute('SELECT watermark, window_end, missing, updated_at FROM branch_watermarks '
+                                         'WHERE state_key = ?', (key,)).fetchone()
+            if row is None or time.time() - row[3] > self.max_age:
+                self.counters['full'] += 1
+                return None
+            self.counters['incremental'] += 1
+        missing = json.loads(row[2])
+        for commit in missing:
+            commit['merge_time'] = datetime.strptime(commit['merge_time'], TIME_FORMAT)
+        return {
+            'watermark': datetime.strptime(row[0], TIME_FORMAT),
+            'end': row[1],
+            'missing': missing
+        }
+
+    def put(self, key, watermark, end, missing):
+        '''
+        Stores the state of a complete comparison of one branch variant
+
+        Parameters
+        --------------------------------
+        key: <str>
+            key of the comparison
+        watermark: <datetime.datetime>
+            merge time (UTC) of the newest source change seen
+        end: <float>
+            timestamp of the window end, None without a window
+        missing: <list>
+            commits missing in the target branch
+        '''
+        missing = json.dumps([dict(commit, merge_time=commit['merge_time'].strftime(TIME_FORMAT))
+                              for commit in missing])
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO branch_watermarks VALUES (?, ?, ?, ?, ?)',
+                               (key, watermark.strftime(TIME_FORMAT), end, missing, time.time()))
+            connection.execute('DELETE FROM branch_watermarks WHERE updated_at < ?', (time.time() - self.max_age,))
+            connection.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.connect().execute('SELECT COUNT(*) FROM branch_watermarks').fetchone()[0]
+            return dict(self.counters, entries=entries)
+
+
+def branch_watermarks():
+    '''
+    Returns the branch watermarks configured in config/cache.json, None when disabled
+    '''
+    settings = load_cache_settings('branch_watermarks', DEFAULTS)
+    if not settings['enabled']:
+        return None
+    return BranchWatermarks(settings['path'], settings['max_age_seconds'])
+
+
+shared_watermarks = branch_watermarks()
@@ -0,0 +1,26 @@
+import os
+import json
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = BASE_DIR + '/cache'
+
+
+def load_cache_settings(section, defaults):
+    '''
+    Returns the settings of the given cache section, the optional config/cache.json
+    overrides the given defaults
+
+    Parameters
+    --------------------------------
+    section: <str>
+        cache name in config/cache.json
+    defaults: <dict>
+        default settings of the cache
+    '''
+    settings = dict(defaults)
+    try:
+        with open(BASE_DIR + '/config/cache.json', 'r') as cache_file:
+            settings.update(json.load(cache_file).get(section, {}))
+    except FileNotFoundError:
+        pass
+    return settings
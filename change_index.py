@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import random
+import sys
+import timeit
+
+
+class ChangeIdIndex:
+    '''
+    Hashed index of change ids replacing list membership checks. The ids are interned,
+    so the same Change-Id read from many log pages and change queries is stored once.
+
+    Attributes
+    --------------------------------
+    change_ids: <set>
+        interned change ids
+
+    Methods
+    --------------------------------
+    add(change_id)
+        adds one change id
+    update(change_ids)
+        adds the given change ids
+    __contains__(change_id)
+        checks the change id is in the index
+    '''
+
+    def __init__(self, change_ids=()):
+        self.change_ids = set()
+        self.update(change_ids)
+
+    def add(self, change_id):
+        self.change_ids.add(sys.intern(change_id))
+
+    def update(self, change_ids):
+        for change_id in change_ids:
+            self.add(change_id)
+        return self
+
+    __iadd__ = update
+
+    def __contains__(self, change_id):
+        return change_id in self.change_ids
+
+    def __len__(self):
+        return len(self.change_ids)
+
+    def __iter__(self):
+        return iter(self.change_ids)
+
+
+def random_change_id():
+    return 'I' + '%040x' % random.getrandbits(160)
+
+
+if __name__ == '__main__':
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lookups = 1000
+
+    target_change_ids = [random_change_id() for count in range(total)]
+    # half of the source changes are in the target branch, like a typical comparison
+    source_change_ids = random.sample(target_change_ids, lookups // 2) + \
+        [random_change_id() for count in range(lookups // 2)]
+
+    as_list = list(target_change_ids)
+    as_index = ChangeIdIndex(target_change_ids)
+
+    def check(index):
+        return [change_id for change_id in source_change_ids if change_id not in index]
+
+    assert check(as_list) == check(as_index)
+
+    list_time = min(timeit.repeat(lambda: check(as_list), number=1, repeat=3))
+    index_time = min(timeit.repeat(lambda: check(as_index), number=20, repeat=3)) / 20
+
+    print('%s lookups against %s change ids' % (lookups, total))
+    print('list           : %10.3f ms' % (list_time * 1000))
+    print('ChangeIdIndex  : %10.3f ms  (%.0fx)' % (index_time * 1000, list_time / index_time))
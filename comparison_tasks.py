@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+
+import json
+from datetime import datetime
+from distutils.version import LooseVersion
+
+import requests
+from pytz import timezone
+
+from branch_comparator import BranchComparison
+from release_comparator import ReleaseComparison
+from report_writer import REPORT_WRITERS
+from report_cache import shared_report_cache
+from metrics import comparison_seconds, comparison_stage_seconds
+
+
+def use_sessions(comparison, sessions, req_data, progress=None):
+    '''
+    Makes the comparison log in through the given warm sessions, write the report
+    format requested and report its progress to the given job
+    '''
+    if req_data.get('report_format'):
+        comparison.report_format = req_data['report_format']
+    if sessions is not None:
+        comparison.login_gerrit = sessions.gerrit
+        comparison.login_jira = sessions.jira
+    if progress is not None:
+        login_gerrit = comparison.login_gerrit
+        comparison.progress = progress
+        comparison.login_gerrit = lambda gerrit_key, creds=None: progress.track(login_gerrit(gerrit_key, creds))
+    return comparison
+
+
+def report_format_error(req_data):
+    '''
+    Returns the error response of an unsupported report format, None when it is supported
+    '''
+    if req_data.get('report_format') and req_data['report_format'] not in REPORT_WRITERS:
+        return {'error': 'Unsupported report format "%s", use one of %s'
+                         % (req_data['report_format'], ', '.join(REPORT_WRITERS))}
+    return None
+
+
+def to_window_time(value, timezone_val):
+    '''
+    Converts a date of the request to the time zone selected by the user
+    '''
+    value = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone('UTC'))
+    if timezone_val == 'pst':
+        return value.astimezone(timezone('US/Pacific'))
+    elif timezone_val == 'ist':
+        return value.astimezone(timezone('Asia/Kolkata'))
+    elif timezone_val == 'est':
+        return value.astimezone(timezone('US/Eastern'))
+    return value
+
+
+def username(creds):
+    return (creds or {}).get('username')
+
+
+def run_cached(request_key, freshness_token, run):
+    '''
+    Returns the cached results of an identical request when nothing was merged since,
+    otherwise runs the comparison and caches its results and report
+
+    Parameters
+    --------------------------------
+    request_key: <dict>
+        normalized request
+    freshness_token: <function>
+        returns the freshness token of the compared data
+    run: <function>
+        runs the comparison and returns the response data
+    '''
+    if shared_report_cache is None:
+        return run()
+    try:
+        cache_key = shared_report_cache.key(request_key, freshness_token())
+    except Exception as e:
+        print('Report cache skipped: %s' % e)
+        return run()
+    results = shared_report_cache.get(cache_key)
+    if results is not None:
+        print('Report served from the cache: %s' % results.get('report_file_name'))
+        return results
+    results = run()
+    if results and 'error' not in results:
+        shared_report_cache.put(cache_key, results, results.get('report_file_name'))
+    return results
+
+
+def with_stats(results, comparison, request_key):
+    '''
+    Adds the instrumentation of the run to the response data under "stats", with the
+    log walk of every project of a branch comparison, logs it as one JSON record and
+    adds it to the app metrics
+    '''
+    stats = comparison.stats.summary()
+    if getattr(comparison, 'log_walks', None) is not None:
+        stats['log_walks'] = comparison.log_walks
+    comparison_seconds.observe(stats['total_seconds'], comparison=request_key['comparison'],
+                               outcome='error' if results.get('error') else 'ok')
+    for stage, counter in stats['stages'].items():
+        comparison_stage_seconds.observe(counter['seconds'], comparison=request_key['comparison'], stage=stage)
+    print('Comparison stats: %s' % json.dumps({
+        'request': {key: value for key, value in request_key.items() if key != 'users'},
+        'error': results.get('error'),
+        'stats': stats
+    }, default=str))
+    results['stats'] = stats
+    return results
+
+
+def collect_issues(results):
+    '''
+    Returns the JQL of all the issues of the results and converts the merge times to strings
+    '''
+    issues = []
+    for gerrit in results.values():
+        for change_list in gerrit.values():
+            for change in change_list:
+                issues += change['issues']
+                change['merge_time'] = str(change['merge_time'])
+    return 'issue in (' + ', '.join(issues) + ')'
+
+
+def compare_branch_task(req_data, primary_gerrit, rdk_gerrit, sessions=None, progress=None):
+    '''
+    Runs the branch comparison of a /compare_branch request and returns the response data
+
+    Parameters
+    --------------------------------
+    req_data: <dict>
+        request body
+    primary_gerrit: <dict>
+        credentials of the primary Gerrit
+    rdk_gerrit: <dict>
+        credentials of the RDK Gerrit
+    sessions: <WarmSessions>
+        logged in clients to reuse, None to log in
+    progress: <Job>
+        job reporting the progress of the comparison, None outside of a job
+    '''
+    if report_format_error(req_data):
+        return report_format_error(req_data)
+
+    start = req_data['start']
+    end = req_data['end']
+    source = req_data['source']
+    target = req_data['target']
+
+    devices = req_data['devices']
+    timezone_val = req_data['timezone_val']
+    gerrit_option = req_data['gerrit_option']
+
+    if not start or not end:
+        start, end = 'NO_START', 'NO_END'
+    else:
+        start = to_window_time(start, timezone_val)
+        end = to_window_time(end, timezone_val)
+
+    print(req_data)
+    print('---------------------------')
+
+    branch_comparison = use_sessions(BranchComparison(start, end, False, timezone_val), sessions,
+                                     req_data, progress)
+
+    branch_comparison.is_dev_specific = True
+    branch_comparison.incremental = not req_data.get('full_run')
+    branch_comparison.devices = []
+    for k, v in devices.items():
+        if v:
+            branch_comparison.devices += [u for u, w in v.items() if w is True]
+
+    print('------------------------------------------')
+    print(branch_comparison.devices)
+
+    if gerrit_option == 'ccp':
+        branch_comparison.gerrits = ['primary_gerrit']
+    elif gerrit_option == 'rdk':
+        branch_comparison.gerrits = ['rdk_gerrit']
+
+    request_key = {
+        'comparison': 'branch',
+        'source': source,
+        'target': target,
+        'devices': sorted(branch_comparison.devices),
+        'start': str(start),
+        'end': str(end),
+        'gerrit_option': gerrit_option,
+        'branch_report_type': req_data.get('branch_report_type'),
+        'report_format': branch_comparison.report_format,
+        'users': [username(primary_gerrit), username(rdk_gerrit)]
+    }
+    results = run_cached(request_key,
+                         lambda: branch_comparison.freshness_token(source, target, primary_gerrit, rdk_gerrit),
+                         lambda: run_branch_comparison(branch_comparison, source, target, primary_gerrit,
+                                                       rdk_gerrit, gerrit_option))
+    return with_stats(results, branch_comparison, request_key)
+
+
+def run_branch_comparison(branch_comparison, source, target, primary_gerrit, rdk_gerrit, gerrit_option):
+    '''
+    Compares the branches and builds the response data with the report
+    '''
+    try:
+        results = branch_comparison.compare_branches(source, target, primary_gerrit, rdk_gerrit)
+    except requests.exceptions.HTTPError as e:
+        print("-------------------Exception------------------------------")
+        print(e)
+        print('--------------------*************--------------------------')
+        return {'error': "Invalid Gerrit username or password!"}
+    except Exception as e:
+        print("-------------------Exception------------------------------")
+        print(e)
+        print('--------------------*************--------------------------')
+        return {'error': str(e)}
+    if results:
+        print('--------------------Results-------------------------')
+        print(results, type(results))
+        if results.get('report_file_name'):
+            del results['report_file_name']
+        jql = collect_issues(results)
+        if len(branch_comparison.exceptional_repos) > 0:
+            print('Below project(s) do not have the target branch ({}):'.format(branch_comparison.branch2))
+        branch_comparison.progress.stage('report')
+        with branch_comparison.stats.timer('report'):
+            report_file_name = branch_comparison.generate_report()
+        print(len(jql.split(',')))
+        results['report_file_name'] = report_file_name
+        results['all_results'] = jql
+    else:
+        print('\n*** No merge pending tickets ***\n')
+
+    if gerrit_option == 'ccp':
+        results['rdk_gerrit'] = {'changes': []}
+    elif gerrit_option == 'rdk':
+        results['primary_gerrit'] = {'changes': []}
+
+    return results
+
+
+def compare_release_task(req_data, primary_gerrit, rdk_gerrit, sessions=None, progress=None):
+    '''
+    Runs the release comparison of a /compare_release request and returns the response data
+
+    Parameters
+    --------------------------------
+    req_data: <dict>
+        request body
+    primary_gerrit: <dict>
+        credentials of the primary Gerrit
+    rdk_gerrit: <dict>
+        credentials of the RDK Gerrit
+    sessions: <WarmSessions>
+        logged in clients to reuse, None to log in
+    progress: <Job>
+        job reporting the progress of the comparison, None outside of a job
+    '''
+    print(req_data)
+    if report_format_error(req_data):
+        return report_format_error(req_data)
+
+    project_name = req_data.get('project_name')
+
+    manifest_file = req_data.get('manifest_file')
+    release_report_type = req_data.get('release_report_type')
+    selected_device_release = req_data.get('selected_device_release')
+
+    source_release_tag = req_data['source_release_tag']
+    target_release_tag = req_data['target_release_tag']
+
+    gerrit_option = req_data['gerrit_option']
+
+    try:
+        source_release_no = source_release_tag.split('_')[-1]
+        target_release_no = target_release_tag.split('_')[-1]
+
+        source_model = "".join(source_release_tag.split('_')[0:-1])
+        target_model = "".join(target_release_tag.split('_')[0:-1])
+        if source_model == '':
+            raise ValueError
+
+        if LooseVersion(source_release_no) > LooseVersion(target_release_no):
+            return {'error': 'Please check your Input!!! '
+                             'Source release number "%s" is greater than target release number "%s"'
+                             % (source_release_no, target_release_no)}
+
+    except ValueError as e:
+        return {'error': 'Invalid source/target release tag, Please check your input! '}
+
+    if source_model != target_model:
+        return {'error': 'Please check your Input!!! Source tag "%s" not same as '
+                         'target tag "%s"' % (source_model, target_model)}
+
+    if release_report_type == 'missing':
+        diff_report = False
+    else:
+        source_release_tag, target_release_tag = target_release_tag, source_release_tag
+        source_release_no, target_release_no = target_release_no, source_release_no
+        diff_report = True
+        if project_name:
+            print(project_name)
+            if len(project_name.split(",")) > 10:
+                return {'error': 'maximum project limit is 10'}
+
+    release_comparison = use_sessions(ReleaseComparison(source_release_no, target_release_no,
+                                                        source_release_tag, target_release_tag,
+                                                        selected_device_release,
+                                                        project_name, manifest_file, diff_report),
+                                      sessions, req_data, progress)
+
+    if gerrit_option == 'ccp':
+        release_comparison.gerrits = ['primary_gerrit']
+    elif gerrit_option == 'rdk':
+        release_comparison.gerrits = ['rdk_gerrit']
+
+    request_key = {
+        'comparison': 'release',
+        'source_release_tag': source_release_tag,
+        'target_release_tag': target_release_tag,
+        'selected_device_release': selected_device_release,
+        'project_name': sorted(project_name.split(',')) if project_name else None,
+        'manifest_file': manifest_file,
+        'gerrit_option': gerrit_option,
+        'release_report_type': release_report_type,
+        'report_format': release_comparison.report_format,
+        'users': [username(primary_gerrit), username(rdk_gerrit)]
+    }
+    results = run_cached(request_key,
+                         lambda: release_comparison.freshness_token(primary_gerrit, rdk_gerrit),
+                         lambda: run_release_comparison(release_comparison, primary_gerrit, rdk_gerrit,
+                                                        gerrit_option))
+    return with_stats(results, release_comparison, request_key)
+
+
+def run_release_comparison(release_comparison, primary_gerrit, rdk_gerrit, gerrit_option):
+    '''
+    Compares the release tags and builds the response data with the report
+    '''
+    start = datetime.now()
+
+    print("Start Time:%s" % start)
+
+    try:
+        results = release_comparison.compare_relase_tags(primary_gerrit, rdk_gerrit)
+    except requests.exceptions.HTTPError as e:
+        print("-------------------Exception------------------------------")
+        print(e)
+        print('--------------------*************--------------------------')
+        return {'error': "Invalid Gerrit Username or Password!"}
+    except Exception as e:
+        print("-------------------Exception------------------------------")
+        print(e)
+        print('--------------------*************--------------------------')
+        return {'error': 'Unable to get report, Please contact support'}
+
+    if results:
+        if results.get('report_file_name'):
+            del results['report_file_name']
+        jql = collect_issues(results)
+        print('\nCommit-IDs which are available in %s  but NOT available in  %s'
+              % (release_comparison.source_release_tag, release_comparison.target_release_tag))
+        print('\n')
+        print(jql)
+        print('\n')
+        if len(release_comparison.exceptional_repos) > 0:
+            print('Below project(s) do not have the check point '
+                  'release number ({0}), ({1}):'.format(release_comparison.source_release_no,
+                                                        release_comparison.target_release_no))
+            print(' ,'.join(release_comparison.exceptional_repos))
+        release_comparison.progress.stage('report')
+        with release_comparison.stats.timer('report'):
+            report_file_name = release_comparison.generate_report()
+        results['report_file_name'] = report_file_name
+        results['all_results'] = jql
+    else:
+        print('\n*** No changes ***\n')
+        results = {}
+
+    end = datetime.now()
+
+    print("Total Time:%s" % (end - start))
+
+    if gerrit_option == 'ccp':
+        results['rdk_gerrit'] = {'changes': []}
+    elif gerrit_option == 'rdk':
+        results['primary_gerrit'] = {'changes': []}
+
+    return results
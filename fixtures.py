@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import base64
+import hashlib
+import json
+import os
+import threading
+
+from session_observers import observe_responses
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STANDIN_DEFAULTS = {
+    'urls': {},
+    'record_dir': None
+}
+
+
+def load_standin_settings():
+    '''
+    Returns the stand-in settings, the optional config/standin.json overrides the
+    defaults: "urls" replaces the base URL of a service ('primary_gerrit', 'rdk_gerrit'
+    or 'jira') and "record_dir" records the responses of the services as fixtures
+    '''
+    settings = dict(STANDIN_DEFAULTS)
+    try:
+        with open(BASE_DIR + '/config/standin.json', 'r') as standin_file:
+            settings.update(json.load(standin_file))
+    except FileNotFoundError:
+        pass
+    return settings
+
+
+standin_settings = load_standin_settings()
+
+
+def service_url(service, default):
+    '''
+    Returns the base URL of the service, the one configured in config/standin.json
+    (usually the replay server) or the given default
+    '''
+    return standin_settings['urls'].get(service) or default
+
+
+def fixture_key(service, method, path, body=b''):
+    '''
+    Returns the name of the fixture of a request, path is relative to the service base
+    URL and keeps its query string
+    '''
+    return hashlib.sha1(json.dumps([service, method.upper(), path, hashlib.sha1(body or b'').hexdigest()])
+                        .encode('utf-8')).hexdigest()
+
+
+def fixture_path(directory, service, key):
+    return os.path.join(directory, service, key + '.json')
+
+
+class FixtureRecorder:
+    '''
+    Writes every response of a service below its base URL to a fixture file, the last
+    response of a request wins
+
+    Attributes
+    --------------------------------
+    directory: <str>
+        fixture directory, one sub directory per service
+    service: <str>
+        'primary_gerrit', 'rdk_gerrit' or 'jira'
+    base_url: <str>
+        base URL of the service, stripped from the recorded paths
+    '''
+
+    def __init__(self, directory, service, base_url):
+        self.directory = directory
+        self.service = service
+        self.base_url = base_url.rstrip('/')
+        self.lock = threading.Lock()
+
+    def __call__(self, response, *args, **kwargs):
+        url = response.request.url
+        if not url.startswith(self.base_url):
+            return
+        path = url[len(self.base_url):]
+        body = response.request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        key = fixture_key(self.service, response.request.method, path, body)
+        fixture = {
+            'service': self.service,
+            'method': response.request.method,
+            'path': path,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type'),
+            'body_base64': base64.b64encode(response.content).decode('ascii')
+        }
+        file_path = fixture_path(self.directory, self.service, key)
+        with self.lock:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path + '.tmp', 'w') as fixture_file:
+                json.dump(fixture, fixture_file, indent=1)
+            os.replace(file_path + '.tmp', file_path)
+
+
+def record_responses(session, service, base_url):
+    '''
+    Records the responses of the given requests session as fixtures when "record_dir"
+    is set in config/standin.json, returns whether they are recorded
+    '''
+    if not standin_settings['record_dir']:
+        return False
+    directory = os.path.join(BASE_DIR, standin_settings['record_dir'])
+    observe_responses(session, FixtureRecorder(directory, service, base_url))
+    print('Recording the %s responses to %s' % (service, directory))
+    return True
+
+
+class FixtureStore:
+    '''
+    Recorded fixtures of a directory, each one read once when first requested
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fixtures = {}
+        self.lock = threading.Lock()
+
+    def find(self, service, method, path, body=b''):
+        key = fixture_key(service, method, path, body)
+        with self.lock:
+            if key not in self.fixtures:
+                try:
+                    with open(fixture_path(self.directory, service, key), 'r') as fixture_file:
+                        fixture = json.load(fixture_file)
+                    fixture['body'] = base64.b64decode(fixture['body_base64'])
+                except FileNotFoundError:
+                    fixture = None
+                self.fixtures[key] = fixture
+            return self.fixtures[key]
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+
+from cache_settings import CACHE_DIR, load_cache_settings
+
+DEFAULTS = {
+    'enabled': True,
+    'path': CACHE_DIR + '/issue_parents.sqlite3',
+    'ttl_hours': 24 * 7,
+    'negative_ttl_hours': 6,
+    'max_entries': 200000
+}
+
+
+class IssueParentCache:
+    '''
+    Persistent issue key -> parent key cache stored in SQLite. Issues without a parent
+    are stored too, with a shorter expiry, so a parent set after the first lookup shows
+    up within negative_ttl_hours.
+
+    Attributes
+    --------------------------------
+    path: <str>
+        SQLite database file
+    ttl: <int>
+        seconds an entry stays valid
+    negative_ttl: <int>
+        seconds an entry without a parent stays valid
+    max_entries: <int>
+        entries kept, the least recently used ones are evicted above it
+    hits: <int>
+        keys served from the cache
+    misses: <int>
+        keys missing or expired in the cache
+
+    Methods
+    --------------------------------
+    get_many(issue_keys)
+        returns the cached parents of the given issue keys
+    set_many(parents)
+        stores the given issue key -> parent key mapping
+    stats()
+        returns the cache counters
+    '''
+
+    def __init__(self, path=DEFAULTS['path'], ttl_hours=DEFAULTS['ttl_hours'],
+                 max_entries=DEFAULTS['max_entries'], negative_ttl_hours=DEFAULTS['negative_ttl_hours']):
+        self.path = path
+        self.ttl = int(ttl_hours * 3600)
+        self.negative_ttl = int(min(negative_ttl_hours, ttl_hours) * 3600)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS issue_parent ('
+                                    'issue_key TEXT PRIMARY KEY, parent_key TEXT, '
+                                    'fetched_at REAL NOT NULL, used_at REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS issue_parent_used_at '
+                                    'ON issue_parent (used_at)')
+            self.connection.commit()
+        return self.connection
+
+    def get_many(self, issue_keys):
+        '''
+        Returns the fresh cached parents of the given issue keys, None for the
+        issues known to have no parent
+
+        Parameters
+        --------------------------------
+        issue_keys: <iterable>
+            issue keys to be looked up
+        '''
+        issue_keys = list(set(issue_keys))
+        now = time.time()
+        cached = {}
+        with self.lock:
+            connection = self.connect()
+            for index in range(0, len(issue_keys), 500):
+                chunk = issue_keys[index:index + 500]
+                rows = connection.execute(
+                    'SELECT issue_key, parent_key FROM issue_parent WHERE fetched_at >= '
+                    '(CASE WHEN parent_key IS NULL THEN ? ELSE ? END) AND issue_key IN (%s)'
+                    % ','.join('?' * len(chunk)), [now - self.negative_ttl, now - self.ttl] + chunk)
+                cached.update(rows.fetchall())
+            if cached:
+                connection.executemany('UPDATE issue_parent SET used_at = ? WHERE issue_key = ?',
+                                       [(now, key) for key in cached])
+                connection.commit()
+            self.hits += len(cached)
+            self.misses += len(issue_keys) - len(cached)
+        return cached
+
+    def set_many(self, parents):
+        '''
+        Stores the given issue key -> parent key mapping and evicts the least
+        recently used entries above the size bound
+
+        Parameters
+        --------------------------------
+        parents: <dict>
+            issue key -> parent key, None for issues without a parent
+        '''
+        if not parents:
+            return
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.executemany('INSERT OR REPLACE INTO issue_parent VALUES (?, ?, ?, ?)',
+                                   [(key, parent, now, now) for key, parent in parents.items()])
+            connection.execute('DELETE FROM issue_parent WHERE issue_key IN (SELECT issue_key '
+                               'FROM issue_parent ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                               (self.max_entries,))
+            connection.commit()
+
+    def stats(self):
+        '''
+        Returns the hit/miss counters and the number of stored entries
+        '''
+        with self.lock:
+            entries = self.connect().execute('SELECT COUNT(*) FROM issue_parent').fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+                'entries': entries
+            }
+
+
+def issue_parent_cache():
+    '''
+    Returns the issue parent cache configured in config/cache.json, None when disabled
+    '''
+    settings = load_cache_settings('issue_parent_cache', DEFAULTS)
+    if not settings['enabled']:
+        return None
+    return IssueParentCache(settings['path'], settings['ttl_hours'], settings['max_entries'],
+                            settings['negative_ttl_hours'])
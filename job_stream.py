@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import json
+import queue
+
+from jobs import Job
+
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream'
+}
+
+
+class StreamingJob(Job):
+    '''
+    Job whose comparison publishes its partial results, each project compared or page
+    of changes checked, as frames read by the streaming response while it runs
+    '''
+
+    def __init__(self, kind):
+        super().__init__(kind)
+        self.frames = queue.Queue()
+
+    def publish(self, kind, data):
+        self.frames.put((kind, data))
+
+    def finish(self, state, result=None, error=None):
+        super().finish(state, result, error)
+        self.frames.put((None, None))
+
+    def summary(self):
+        '''
+        Returns the last frame: the state of the job, the JQL of the issues, the report
+        link and the number of changes per gerrit
+        '''
+        status = self.status()
+        result = self.result or {}
+        status['all_results'] = result.get('all_results')
+        status['changes'] = {gerrit: len(data['changes']) for gerrit, data in result.items()
+                             if isinstance(data, dict) and 'changes' in data}
+        return status
+
+
+def format_frame(kind, data, stream_format):
+    data = json.dumps(data, default=str)
+    if stream_format == 'sse':
+        return 'event: %s\ndata: %s\n\n' % (kind, data)
+    return '{"type": "%s", "data": %s}\n' % (kind, data)
+
+
+def stream_frames(job, stream_format, heartbeat_seconds=15):
+    '''
+    Yields the frames of the job as they are published, a heartbeat when nothing was
+    published for heartbeat_seconds, then the summary. The job is cancelled when the
+    client goes away.
+
+    Parameters
+    --------------------------------
+    job: <StreamingJob>
+        job running the comparison
+    stream_format: <str>
+        'ndjson' or 'sse'
+    heartbeat_seconds: <int>
+        seconds without frames before a heartbeat keeps the connection open
+    '''
+    try:
+        yield format_frame('job', job.status(), stream_format)
+        while True:
+            try:
+                kind, data = job.frames.get(timeout=heartbeat_seconds)
+            except queue.Empty:
+                yield ': heartbeat\n\n' if stream_format == 'sse' else format_frame('heartbeat', {}, stream_format)
+                continue
+            if kind is None:
+                break
+            yield format_frame(kind, data, stream_format)
+        yield format_frame('summary', job.summary(), stream_format)
+    except GeneratorExit:
+        job.cancel_requested.set()
+        raise
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import uuid
+
+JOB_STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+
+class ComparisonCancelled(Exception):
+    '''
+    Raised in a comparison at its next API call once its job is cancelled
+    '''
+
+
+class Progress:
+    '''
+    Progress of a comparison, the current stage with the units of work done out of its
+    total and the API calls made. This base class records nothing, it is the progress of
+    the comparisons run outside of a job.
+
+    Methods
+    --------------------------------
+    stage(name, total)
+        starts a stage of total units of work, None when unknown
+    advance(count)
+        marks count units of work of the stage done
+    check()
+        raises ComparisonCancelled when the comparison was cancelled
+    track(gerrit)
+        returns the Gerrit client counting its calls in the progress
+    publish(kind, data)
+        publishes a partial result of the comparison
+    '''
+
+    def stage(self, name, total=None):
+        pass
+
+    def advance(self, count=1):
+        pass
+
+    def api_call(self):
+        pass
+
+    def check(self):
+        pass
+
+    def track(self, gerrit):
+        return gerrit
+
+    def publish(self, kind, data):
+        pass
+
+
+class TrackedGerrit:
+    '''
+    Gerrit client which counts its calls in the progress and checks before each one
+    whether the comparison was cancelled, everything else is the wrapped client's
+    '''
+
+    def __init__(self, gerrit, progress):
+        self.gerrit = gerrit
+        self.progress = progress
+
+    def get(self, *args, **kwargs):
+        self.progress.check()
+        self.progress.api_call()
+        return self.gerrit.get(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.gerrit, name)
+
+
+class Job(Progress):
+    '''
+    Comparison run in the background, its progress is polled and it is cancelled
+    cooperatively: the comparison stops at its next Gerrit call
+
+    Attributes
+    --------------------------------
+    job_id: <str>
+        id of the job
+    kind: <str>
+        'branch' or 'release'
+    state: <str>
+        one of JOB_STATES
+    result: <dict>
+        response data of the comparison once finished
+    '''
+
+    def __init__(self, kind):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = 'queued'
+        self.stage_name = 'queued'
+        self.done = 0
+        self.total = None
+        self.api_calls = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stage_started = time.monotonic()
+        self.cancel_requested = threading.Event()
+        self.lock = threading.Lock()
+
+    def stage(self, name, total=None):
+        with self.lock:
+            self.stage_name = name
+            self.done = 0
+            self.total = total
+            self.stage_started = time.monotonic()
+
+    def advance(self, count=1):
+        with self.lock:
+            self.done += count
+
+    def api_call(self):
+        with self.lock:
+            self.api_calls += 1
+
+    def check(self):
+        if self.cancel_requested.is_set():
+            raise ComparisonCancelled('Job %s cancelled' % self.job_id)
+
+    def track(self, gerrit):
+        return TrackedGerrit(gerrit, self)
+
+    def eta(self):
+        '''
+        Returns the seconds left in the current stage at the rate of the work done so far,
+        None when the stage has no known total
+        '''
+        if not self.total or not self.done or self.finished_at:
+            return None
+        rate = (time.monotonic() - self.stage_started) / self.done
+        return round(rate * max(self.total - self.done, 0), 1)
+
+    def finish(self, state, result=None, error=None):
+        with self.lock:
+            self.state = state
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+
+    def status(self):
+        with self.lock:
+            status = {
+                'job_id': self.job_id,
+                'type': self.kind,
+                'state': self.state,
+                'stage': self.stage_name,
+                'done': self.done,
+                'total': self.total,
+                'api_calls': self.api_calls,
+                'created_at': self.created_at,
+                'elapsed_seconds': round((self.finished_at or time.time()) - self.started_at, 1)
+                if self.started_at else 0,
+                'error': self.error
+            }
+        status['eta_seconds'] = self.eta()
+        if self.state == 'done':
+            status['result_url'] = '/jobs/%s/result' % self.job_id
+            if self.result and self.result.get('report_file_name'):
+                status['report_url'] = '/files/' + self.result['report_file_name']
+        return status
+
+
+class JobRegistry:
+    '''
+    Comparison jobs run on the comparison executor, so the jobs share its bounded worker
+    pool and queue with the synchronous requests. Finished jobs are kept for
+    retention_seconds for their results to be fetched. Jobs only exist in the process
+    running them, app.wsgi requires a single mod_wsgi daemon process.
+
+    Methods
+    --------------------------------
+    submit(kind, task, *args)
+        queues task(*args, progress=job) and returns the job, raises ExecutorBusy when
+        the executor queue is full
+    submit_job(job, task, *args)
+        same with the given job
+    get(job_id)
+        returns the job, None when unknown or expired
+    cancel(job_id)
+        requests the cancellation of the job, returns the job
+    '''
+
+    def __init__(self, executor, retention_seconds=3600):
+        self.executor = executor
+        self.retention_seconds = retention_seconds
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, kind, task, *args):
+        return self.submit_job(Job(kind), task, *args)
+
+    def submit_job(self, job, task, *args):
+        self.purge()
+        with self.lock:
+            self.jobs[job.job_id] = job
+        try:
+            self.executor.submit(self.run, job, task, *args)
+        except Exception:
+            with self.lock:
+                del self.jobs[job.job_id]
+            raise
+        return job
+
+    def run(self, job, task, *args):
+        # a job cancelled while queued still goes through the executor so that its
+        # queue slot is released, it just does not start
+        if job.cancel_requested.is_set():
+            job.finish('cancelled')
+            return
+        with job.lock:
+            job.state = 'running'
+            job.started_at = time.time()
+        try:
+            result = task(*args, progress=job)
+        except Exception as e:
+            job.finish('cancelled' if job.cancel_requested.is_set() else 'failed', error=str(e))
+            raise
+        if job.cancel_requested.is_set():
+            job.finish('cancelled')
+        elif result and 'error' in result:
+            job.finish('failed', result, result['error'])
+        else:
+            job.finish('done', result)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.state in ('queued', 'running'):
+            job.cancel_requested.set()
+        return job
+
+    def purge(self):
+        now = time.time()
+        with self.lock:
+            for job_id in [job_id for job_id, job in self.jobs.items()
+                           if job.finished_at and now - job.finished_at > self.retention_seconds]:
+                del self.jobs[job_id]
+
+    def stats(self):
+        with self.lock:
+            states = [job.state for job in self.jobs.values()]
+        return {state: states.count(state) for state in JOB_STATES}
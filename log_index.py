@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import threading
+import time
+
+from cache_settings import CACHE_DIR, load_cache_settings
+
+DEFAULTS = {
+    'enabled': True,
+    'path': CACHE_DIR + '/gitiles_log_index.sqlite3',
+    'max_age_seconds': 300
+}
+
+
+class GitilesLogIndex:
+    '''
+    Persistent index of the change ids found in the gitiles log of each
+    (gerrit, project, branch). Every entry keeps the head commit it was built from and
+    the first commit not walked yet (with the commit time where the walk stopped), so
+    later runs only fetch the commits above the stored head and can continue an
+    incomplete walk when they need older changes.
+
+    Attributes
+    --------------------------------
+    path: <str>
+        SQLite database file
+    max_age: <int>
+        seconds an entry is used without checking the branch head again
+
+    Methods
+    --------------------------------
+    get(gerrit, project, branch)
+        returns the index entry of the project branch
+    put(gerrit, project, branch, head, tail, tail_time, change_ids)
+        stores the index entry of the project branch
+    touch(gerrit, project, branch)
+        marks the entry as checked against the branch head
+    '''
+
+    def __init__(self, path=DEFAULTS['path'], max_age_seconds=DEFAULTS['max_age_seconds']):
+        self.path = path
+        self.max_age = max_age_seconds
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS log_index ('
+                                    'gerrit TEXT, project TEXT, branch TEXT, head TEXT, tail TEXT, tail_time TEXT, '
+                                    'change_ids TEXT, checked_at REAL, '
+                                    'PRIMARY KEY (gerrit, project, branch))')
+            self.connection.commit()
+        return self.connection
+
+    def get(self, gerrit, project, branch):
+        '''
+        Returns the index entry of the project branch, None when it is not indexed
+
+        Parameters
+        --------------------------------
+        gerrit: <str>
+            gerrit key
+        project: <str>
+            project name
+        branch: <str>
+            branch name
+        '''
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT head, tail, tail_time, change_ids, checked_at FROM log_index '
+                'WHERE gerrit = ? AND project = ? AND branch = ?', (gerrit, project, branch)).fetchone()
+        if row is None:
+            return None
+        head, tail, tail_time, change_ids, checked_at = row
+        return {
+            'head': head,
+            'tail': tail,
+            'tail_time': tail_time,
+            'change_ids': change_ids.split('\n') if change_ids else [],
+            'fresh': time.time() - checked_at < self.max_age
+        }
+
+    def put(self, gerrit, project, branch, head, tail, tail_time, change_ids):
+        '''
+        Stores the index entry of the project branch
+
+        Parameters
+        --------------------------------
+        head: <str>
+            commit the log was walked from
+        tail: <str>
+            first commit not walked yet, None when the whole log is indexed
+        tail_time: <str>
+            gitiles committer time of the last walked commit
+        change_ids: <list>
+            change ids of the walked commits, newest first
+        '''
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO log_index VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (gerrit, project, branch, head, tail, tail_time, '\n'.join(change_ids),
+                                time.time()))
+            connection.commit()
+
+    def touch(self, gerrit, project, branch):
+        with self.lock:
+            connection = self.connect()
+            connection.execute('UPDATE log_index SET checked_at = ? '
+                               'WHERE gerrit = ? AND project = ? AND branch = ?',
+                               (time.time(), gerrit, project, branch))
+            connection.commit()
+
+
+def gitiles_log_index():
+    '''
+    Returns the gitiles log index configured in config/cache.json, None when disabled
+    '''
+    settings = load_cache_settings('gitiles_log_index', DEFAULTS)
+    if not settings['enabled']:
+        return None
+    return GitilesLogIndex(settings['path'], settings['max_age_seconds'])
+
+
+shared_log_index = gitiles_log_index()
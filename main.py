@@ -1,30 +1,116 @@
 import json
 import os
 import copy
-import requests
-from datetime import datetime, timedelta
-from pytz import timezone
+import time
 from jira import JIRA
 
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS, cross_origin
 from werkzeug.http import parse_authorization_header
 
-from distutils.version import LooseVersion
-
-from branch_comparator import BranchComparison
-from release_comparator import ReleaseComparison
 from rmGerritUtils import gerrit_login
+from app_executor import ComparisonExecutor, ExecutorBusy
+from comparison_tasks import compare_branch_task, compare_release_task
+from tag_cache import release_tag_cache
+from jobs import JobRegistry
+from job_stream import STREAM_FORMATS, StreamingJob, stream_frames
+import metrics
+from report_cache import shared_report_cache
+from tag_index import shared_tag_index
+from rmGerritUtils import gerrit_pool
+from rmjirautilites import jira_pool, parent_cache_stats
 
 app = Flask(__name__)
-cors = CORS(app, support_credentials=True)
+cors = CORS(app, support_credentials=True, expose_headers=['X-Total-Count'])
+
+# comparisons of all the requests run on this pool, started once with the app
+executor = ComparisonExecutor.from_config()
+# background comparisons, run on the same pool
+jobs = JobRegistry(executor)
+JOB_TASKS = {
+    'branch': compare_branch_task,
+    'release': compare_release_task
+}
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 DOWNLOAD_DIRECTORY = BASE_DIR + '/'
 
 
+def executor_metrics():
+    stats = executor.stats()
+    return [
+        ({'state': 'running'}, stats['running']),
+        ({'state': 'queued'}, stats['queue_depth'])
+    ]
+
+def cache_counters():
+    '''
+    Hits and misses of every cache, None for the disabled ones
+    '''
+    tags = release_tag_cache.stats()
+    counters = {
+        'release_tags': (tags['hits'] + tags['stale_hits'], tags['fetches']),
+        'report': None,
+        'tag_index': None,
+        'issue_parent': None
+    }
+    if shared_report_cache is not None:
+        counters['report'] = (shared_report_cache.hits, shared_report_cache.misses)
+    if shared_tag_index is not None:
+        stats = shared_tag_index.stats()
+        counters['tag_index'] = (stats['hits'], stats['fetches'])
+    parent_stats = parent_cache_stats()
+    if parent_stats is not None:
+        counters['issue_parent'] = (parent_stats['hits'], parent_stats['misses'])
+    return {cache: counter for cache, counter in counters.items() if counter is not None}
+
+def hit_ratio(hits, misses):
+    return hits / (hits + misses) if hits + misses else 0.0
+
+metrics.registry.collector('rm_comparisons_in_flight', 'Comparisons running or waiting for a worker', 'gauge',
+                           executor_metrics)
+metrics.registry.collector('rm_executor_utilization', 'Share of the workers running a comparison', 'gauge',
+                           lambda: [({}, executor.stats()['utilization'])])
+metrics.registry.collector('rm_executor_busy_ratio', 'Share of the worker time spent comparing since the start',
+                           'gauge', lambda: [({}, executor.stats()['busy_ratio'])])
+metrics.registry.collector('rm_executor_tasks_total', 'Comparisons finished or rejected by the executor', 'counter',
+                           lambda: [({'outcome': outcome}, executor.stats()[outcome])
+                                    for outcome in ('completed', 'failed', 'rejected')])
+metrics.registry.collector('rm_jobs', 'Comparison jobs kept per state', 'gauge',
+                           lambda: [({'state': state}, count) for state, count in jobs.stats().items()])
+metrics.registry.collector('rm_cache_hits_total', 'Cache hits', 'counter',
+                           lambda: [({'cache': cache}, hits) for cache, (hits, misses) in cache_counters().items()])
+metrics.registry.collector('rm_cache_misses_total', 'Cache misses', 'counter',
+                           lambda: [({'cache': cache}, misses) for cache, (hits, misses) in cache_counters().items()])
+metrics.registry.collector('rm_cache_hit_ratio', 'Cache hit ratio since the start', 'gauge',
+                           lambda: [({'cache': cache}, hit_ratio(hits, misses))
+                                    for cache, (hits, misses) in cache_counters().items()])
+metrics.registry.collector('rm_session_pool_clients', 'Logged in clients kept per service', 'gauge',
+                           lambda: [({'service': 'gerrit'}, gerrit_pool.stats()['clients']),
+                                    ({'service': 'jira'}, jira_pool.stats()['clients'])])
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.monotonic()
+
+@app.after_request
+def observe_request(response):
+    # streamed responses are observed when their headers are sent
+    if 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.http_request_seconds.observe(time.monotonic() - g.request_started, route=route,
+                                             method=request.method)
+        metrics.http_requests.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route("/files/<path:path>")
 def get_file(path):
     """Download a file."""
@@ -86,120 +172,15 @@ def update_project_map():
 def home():
     req_data = request.get_json()
 
-    start = req_data['start']
-    end = req_data['end']
-    source = req_data['source']
-    target = req_data['target']
-
-    device_type = req_data['device_type']
-    devices = req_data['devices']
-    device_specific_type = req_data['device_specific_type']
-    timezone_val = req_data['timezone_val']
-    gerrit_option = req_data['gerrit_option']
-
     auth_header = request.headers.get("Authorization")
     rdk_central = request.headers.get("RDK-CENTRAL")
     primary_gerrit = parse_authorization_header(auth_header)
     rdk_gerrit = parse_authorization_header(rdk_central)
 
-    branch_report_type = req_data['branch_report_type']
-
-    if not start or not end:
-        start, end = 'NO_START', 'NO_END'
-    else:
-        start = datetime.strptime(start, '%Y-%m-%dT%H:%M:%S.%fZ')
-        end = datetime.strptime(end, '%Y-%m-%dT%H:%M:%S.%fZ')
-
-        start = start.replace(tzinfo=timezone('UTC'))
-        end = end.replace(tzinfo=timezone('UTC'))
-
-        if timezone_val == 'pst':
-            start = start.astimezone(timezone('US/Pacific'))
-            end = end.astimezone(timezone('US/Pacific'))
-        elif timezone == 'ist':
-            start = start.astimezone(timezone('Asia/Kolkata'))
-            end = end.astimezone(timezone('Asia/Kolkata'))
-        elif timezone_val == 'est':
-            start = start.astimezone(timezone('US/Eastern'))
-            end = end.astimezone(timezone('US/Eastern'))
-
-
-    print(req_data)
-    print('---------------------------')
-
-    branch_comparison = BranchComparison(start, end, False, timezone_val)
-
-    branch_comparison.is_dev_specific = True
-    branch_comparison.devices = []
-    for k,v in devices.items():
-        if v:
-            branch_comparison.devices += [u for u,w in v.items() if w is True]
-
-    # with open(BASE_DIR + '/config/devices.json', 'r') as devices_file:
-    #     all_devices = json.load(devices_file)
-    #
-    # for device in all_devices.values():
-    #     branch_comparison.devices += device
-    #
-    print('------------------------------------------')
-    print(branch_comparison.devices)
-
-    if gerrit_option == 'ccp':
-        branch_comparison.gerrits = ['primary_gerrit']
-    elif gerrit_option == 'rdk':
-        branch_comparison.gerrits = ['rdk_gerrit']
-
     try:
-        results = {}
-        for key in results.keys():
-            del results[key]
-        results = branch_comparison.compare_branches(source, target, primary_gerrit, rdk_gerrit)
-    except requests.exceptions.HTTPError as e:
-        print("-------------------Exception------------------------------")
-        print(e)
-        print('--------------------*************--------------------------')
-        return {'error': "Invalid Gerrit username or password!"}
-    except Exception as  e:
-        print ("-------------------Exception------------------------------")
-        print (e)
-        print('--------------------*************--------------------------')
-        return {'error': str(e)}
-    if results:
-        print('--------------------Results-------------------------')
-        print(results, type(results))
-        if results.get('report_file_name'):
-            del results['report_file_name']
-        issues = []
-        for gerrit in results.values():
-            for change_list in gerrit.values():
-                for change in change_list: issues += change['issues']
-        for gerrit in results.keys():
-            for change_type_key in results[gerrit].keys():
-                for i in range(len(results[gerrit][change_type_key])): results[gerrit][change_type_key][i][
-                    'merge_time'] = str(results[gerrit][change_type_key][i]['merge_time'])
-        #issues_1= ' '.join(issues)
-        #print(type(issues))
-        jql = 'issue in (' + ', '.join(issues)+ ')'
-        # print('\nCommit-IDs which are available in ' + source + ' but NOT available in ' + target)
-        # print('\n')
-        # print(jql)
-        # print('\n')
-        # print(json.dumps(results, indent=2))
-        # print('\n')
-        if len(branch_comparison.exceptional_repos) > 0:
-            print('Below project(s) do not have the target branch ({}):'.format(branch_comparison.branch2))
-            #print(' ,'.join(branch_comparison.exceptional_repos))
-        report_file_name = branch_comparison.generate_report()
-        print(len(jql.split(',')))
-        results['report_file_name'] = report_file_name
-        results['all_results'] = jql
-    else:
-        print('\n*** No merge pending tickets ***\n')
-
-    if  gerrit_option == 'ccp':
-        results['rdk_gerrit'] = {'changes': []}
-    elif gerrit_option == 'rdk':
-        results['primary_gerrit'] = {'changes': []}
+        results = executor.run(compare_branch_task, req_data, primary_gerrit, rdk_gerrit, executor.sessions)
+    except ExecutorBusy as e:
+        return {'error': str(e)}, 503
 
     return jsonify(results)
 
@@ -257,6 +238,11 @@ def get_device_manifest_detail():
 
 
 
+def fetch_release_tags(manifest_project, model_name):
+    url = 'projects/%s/tags?m=%s' % (manifest_project.replace('/', '%2F'), model_name)
+    gerrit = gerrit_login('primary_gerrit')
+    return [r['ref'].replace('refs/tags/', '') for r in gerrit.get(url)]
+
 @app.route("/get_tags", methods=['GET'])
 def get_release_tags():
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -271,34 +257,68 @@ def get_release_tags():
     except KeyError:
         return {"error" : "Invalid device name"}
 
-    url = 'projects/%s/tags?m=%s' % (manifest_project.replace('/', '%2F'), model_name)
-    #print(url)
-    gerrit = gerrit_login('primary_gerrit')
-    res = gerrit.get(url)
-    tags = []
-    for r in res:
-        tag = r['ref'].replace('refs/tags/', '')
-        tags.append(tag)
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return {"error" : "Invalid offset or limit"}, 400
+    if offset < 0 or (limit is not None and limit < 0):
+        return {"error" : "Invalid offset or limit"}, 400
+
+    # served from the cache, refreshed in the background once stale
+    tags = release_tag_cache.get((device_name, model_name),
+                                 lambda: fetch_release_tags(manifest_project, model_name))
+    tags = release_tag_cache.with_prefix(tags, request.args.get('prefix', ''))
+    total = len(tags)
+    tags = tags[offset:] if limit is None else tags[offset:offset + limit]
 
-    return jsonify(tags)
+    response = jsonify(tags)
+    response.headers['X-Total-Count'] = str(total)
+    return response
 
 
 
 @app.route("/compare_release", methods=['POST'])
 def compare_release_tags():
     req_data = request.get_json()
-    print(req_data)
 
-    project_name = req_data.get('project_name')
+    auth_header = request.headers.get("Authorization")
+    rdk_central = request.headers.get("RDK-CENTRAL")
+    primary_gerrit = parse_authorization_header(auth_header)
+    rdk_gerrit = parse_authorization_header(rdk_central)
 
-    manifest_file = req_data.get('manifest_file')
-    release_report_type = req_data.get('release_report_type')
-    selected_device_release = req_data.get('selected_device_release')
+    try:
+        results = executor.run(compare_release_task, req_data, primary_gerrit, rdk_gerrit, executor.sessions)
+    except ExecutorBusy as e:
+        return {'error': str(e)}, 503
 
-    source_release_tag = req_data['source_release_tag']
-    target_release_tag = req_data['target_release_tag']
+    return jsonify(results)
 
-    gerrit_option = req_data['gerrit_option']
+@app.route("/executor_stats", methods=['GET'])
+def executor_stats():
+    stats = executor.stats()
+    stats['jobs'] = jobs.stats()
+    return jsonify(stats)
+
+@app.route("/compare_branch/stream", methods=['POST'])
+def compare_branch_stream():
+    return stream_comparison('branch')
+
+@app.route("/compare_release/stream", methods=['POST'])
+def compare_release_stream():
+    return stream_comparison('release')
+
+def stream_comparison(kind):
+    '''
+    Runs the comparison as a job and streams its partial results as NDJSON or, with
+    ?format=sse or an "Accept: text/event-stream" header, as Server-Sent Events
+    '''
+    req_data = request.get_json()
+    stream_format = request.args.get('format')
+    if stream_format is None:
+        stream_format = 'sse' if 'text/event-stream' in request.headers.get('Accept', '') else 'ndjson'
+    if stream_format not in STREAM_FORMATS:
+        return {'error': 'Stream format must be one of %s' % ', '.join(STREAM_FORMATS)}, 400
 
     auth_header = request.headers.get("Authorization")
     rdk_central = request.headers.get("RDK-CENTRAL")
@@ -306,119 +326,62 @@ def compare_release_tags():
     rdk_gerrit = parse_authorization_header(rdk_central)
 
     try:
-        source_release_no = source_release_tag.split('_')[-1]
-        target_release_no = target_release_tag.split('_')[-1]
-
-        source_model = "".join(source_release_tag.split('_')[0:-1])
-        target_model = "".join(target_release_tag.split('_')[0:-1])
-        if source_model == '':
-            raise ValueError
-
-        if LooseVersion(source_release_no) > LooseVersion(target_release_no):
-            return {'error': 'Please check your Input!!! '
-                             'Source release number "%s" is greater than target release number "%s"'
-                             %(source_release_no, target_release_no)}
-
-    except ValueError as e:
-        return {'error': 'Invalid source/target release tag, Please check your input! '}
-
-    if source_model != target_model:
-        return {'error': 'Please check your Input!!! Source tag "%s" not same as ' \
-               'target tag "%s"' % (source_model, target_model)}
-
-    start = datetime.now()
-
-    print("Start Time:%s" % start)
-
-    if release_report_type == 'missing':    
-        diff_report = False
-    else:
-        source_release_tag, target_release_tag = target_release_tag, source_release_tag
-        source_release_no, target_release_no = target_release_no, source_release_no
-        diff_report = True
-        if project_name:
-            print(project_name)
-            if len(project_name.split(","))>10:
-                return {'error': 'maximum project limit is 10'}
-            else:
-                release_comparison = ReleaseComparison(source_release_no, target_release_no,
-                                                    source_release_tag, target_release_tag,
-                                                    selected_device_release,
-                                                    project_name, manifest_file, diff_report)
-
-
-
-        release_comparison = ReleaseComparison(source_release_no, target_release_no,
-                                                    source_release_tag, target_release_tag,
-                                                    selected_device_release,
-                                                    project_name, manifest_file, diff_report)
-            
-
-    if gerrit_option == 'ccp':
-        release_comparison.gerrits = ['primary_gerrit']
-    elif gerrit_option == 'rdk':
-        release_comparison.gerrits = ['rdk_gerrit']
+        job = jobs.submit_job(StreamingJob(kind), JOB_TASKS[kind], req_data, primary_gerrit, rdk_gerrit,
+                              executor.sessions)
+    except ExecutorBusy as e:
+        return {'error': str(e)}, 503
 
-    try:
-        results = {}
-        for key in results.keys():
-            del results[key]
-        results = release_comparison.compare_relase_tags(primary_gerrit, rdk_gerrit)
-    except requests.exceptions.HTTPError as e:
-        print("-------------------Exception------------------------------")
-        print(e)
-        print('--------------------*************--------------------------')
-        return {'error': "Invalid Gerrit Username or Password!"}
-    except Exception as  e:
-        print ("-------------------Exception------------------------------")
-        print (e)
-        #raise e
-        print('--------------------*************--------------------------')
-        return {'error': 'Unable to get report, Please contact support'}
-
-    if results:
-        if results.get('report_file_name'):
-            del results['report_file_name']
-        issues = []
-        for res in results.values():
-            for change_list in res.values():
-                for change in change_list: issues += change['issues']
-        for gerrit in results.keys():
-            for change_type_key in results[gerrit].keys():
-                for i in range(len(results[gerrit][change_type_key])):
-                    results[gerrit][change_type_key][i]['merge_time'] = str(
-                        results[gerrit][change_type_key][i]['merge_time'])
-        
-        jql = 'issue in (' + ', '.join(issues) + ')'
-        print('\nCommit-IDs which are available in %s  but NOT available in  %s'
-              %(source_release_tag, target_release_tag))
-        print('\n')
-        print(jql)
-        
-        print('\n')
-        #print(json.dumps(results, indent=2))
-        print('\n')
-        if len(release_comparison.exceptional_repos) > 0:
-            print('Below project(s) do not have the check point '
-                  'release number ({0}), ({1}):'.format(source_release_no, target_release_no))
-            print(' ,'.join(release_comparison.exceptional_repos))
-        report_file_name = release_comparison.generate_report()
-        results['report_file_name'] = report_file_name
-        results['all_results'] = jql
-    else:
-        print('\n*** No changes ***\n')
-
-    end = datetime.now()
-
-    print("Total Time:%s" % (end - start))
-
-    if  gerrit_option == 'ccp':
-        results['rdk_gerrit'] = {'changes': []}
-    elif gerrit_option == 'rdk':
-        results['primary_gerrit'] = {'changes': []}
+    return Response(stream_frames(job, stream_format), mimetype=STREAM_FORMATS[stream_format],
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-    return jsonify(results)
+@app.route("/jobs", methods=['POST'])
+def submit_job():
+    req_data = request.get_json(silent=True)
+    if not isinstance(req_data, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+
+    if req_data.get('type') not in JOB_TASKS:
+        return {'error': 'Job type must be one of %s' % ', '.join(JOB_TASKS)}, 400
+
+    auth_header = request.headers.get("Authorization")
+    rdk_central = request.headers.get("RDK-CENTRAL")
+    primary_gerrit = parse_authorization_header(auth_header)
+    rdk_gerrit = parse_authorization_header(rdk_central)
+
+    try:
+        job = jobs.submit(req_data['type'], JOB_TASKS[req_data['type']], req_data, primary_gerrit, rdk_gerrit,
+                          executor.sessions)
+    except ExecutorBusy as e:
+        return {'error': str(e)}, 503
+
+    return jsonify({'job_id': job.job_id, 'status_url': '/jobs/' + job.job_id}), 202
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return {'error': 'Unknown job'}, 404
+    return jsonify(job.status())
+
+@app.route("/jobs/<job_id>/result", methods=['GET'])
+def get_job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return {'error': 'Unknown job'}, 404
+    if job.state in ('queued', 'running'):
+        return jsonify(job.status()), 409
+    if job.state != 'done':
+        return {'error': job.error or 'Job %s' % job.state}, 410 if job.state == 'cancelled' else 500
+    return jsonify(job.result)
+
+@app.route("/jobs/<job_id>", methods=['DELETE'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return {'error': 'Unknown job'}, 404
+    return jsonify(job.status()), 202
 
 
 if __name__ == "__main__":
+    executor.start()
     app.run(host='0.0.0.0', debug=True)
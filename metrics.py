@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+import threading
+from bisect import bisect_left
+
+# upper bounds in seconds of the latency histograms, from a cached API call to a full
+# comparison of 300+ projects
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                          .replace('\n', '\\n'))
+                             for name, value in labels)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    '''
+    Monotonic counter per label set
+    '''
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def labels_key(self, labels):
+        return tuple((name, labels[name]) for name in self.label_names)
+
+    def inc(self, amount=1, **labels):
+        key = self.labels_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Histogram(Counter):
+    '''
+    Histogram per label set, observing a value costs one bisection and one lock
+    '''
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.labels_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (buckets, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), buckets):
+                    cumulative += bucket_count
+                    samples.append((self.name + '_bucket', key + (('le', format_value(bound)),), cumulative))
+                samples.append((self.name + '_sum', key, total))
+                samples.append((self.name + '_count', key, count))
+        return samples
+
+
+class Collector:
+    '''
+    Metric read when scraped, collect() returns (labels dict, value) pairs
+    '''
+
+    def __init__(self, name, help_text, kind, collect):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self):
+        return [(self.name, tuple(labels.items()), value) for labels, value in self.collect()]
+
+
+class Registry:
+    '''
+    In-process metrics rendered in the Prometheus text format
+
+    Methods
+    --------------------------------
+    counter(name, help_text, label_names)
+        registers and returns a counter
+    histogram(name, help_text, label_names, buckets)
+        registers and returns a histogram
+    collector(name, help_text, kind, collect)
+        registers a gauge or counter read from collect() when scraped
+    render()
+        returns the text exposition of all the metrics
+    '''
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def collector(self, name, help_text, kind, collect):
+        return self.register(Collector(name, help_text, kind, collect))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print('Collecting the metric %s failed: %s' % (metric.name, e))
+                continue
+            lines.append('# HELP %s %s' % (metric.name, metric.help_text))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, labels, value in samples:
+                if value is not None:
+                    lines.append('%s%s %s' % (name, format_labels(labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram('rm_http_request_seconds', 'Latency of the HTTP requests per route',
+                                          ('route', 'method'))
+http_requests = registry.counter('rm_http_requests_total', 'HTTP requests per route and status',
+                                 ('route', 'method', 'status'))
+api_call_seconds = registry.histogram('rm_api_call_seconds', 'Latency of the Gerrit and Jira calls',
+                                      ('service', 'family'))
+api_errors = registry.counter('rm_api_errors_total', 'Failed Gerrit and Jira calls by status',
+                              ('service', 'family', 'status'))
+comparison_seconds = registry.histogram('rm_comparison_seconds', 'Duration of the comparisons',
+                                        ('comparison', 'outcome'))
+comparison_stage_seconds = registry.histogram('rm_comparison_stage_seconds',
+                                              'Time spent per stage of a comparison, report generation included',
+                                              ('comparison', 'stage'))
+
+
+def observe_api_call(family, seconds, status=None):
+    '''
+    Records one Gerrit or Jira call, the family starts with the service name
+    '''
+    service, _, family = family.partition(' ')
+    api_call_seconds.observe(seconds, service=service, family=family)
+    if status is not None:
+        api_errors.inc(service=service, family=family, status=status)
@@ -6,14 +6,19 @@ from rmGerritUtils import *
 from datetime import datetime,timedelta
 import pdb
 import copy
-import xlwt
 import xmltodict
-import multiprocessing
-from functools import reduce
+from concurrent.futures import ThreadPoolExecutor
 from progress_bar import *
 import time
 import requests
+from urllib.parse import quote
 from rmjirautilites import *
+from change_index import ChangeIdIndex
+from report_writer import report_writer
+from tag_index import ProjectTags, shared_tag_index
+from jobs import Progress
+from run_stats import RunStats
+from app_executor import load_executor_settings
 
 from distutils.version import LooseVersion
 from jira.resilientsession import PrepareRequestForRetry, ResilientSession
@@ -28,18 +33,42 @@ class ReleaseComparison:
     source release tag: <str>
         source release tag
     final_data: <list>
-    repos_to_be_checked: <list>
-        list of repos to be checked
+    repos_to_be_checked: <set>
+        repos to be checked
     manifests: <dict>
         device manifests details
+    project_workers: <int>
+        number of projects compared concurrently, the threads share one Gerrit session,
+        "project_workers" of config/executor.json
+    merged_chunk_size: <int>
+        number of commits per query of the merged changes lookup
+    tag_index: <TagIndex>
+        tags of the projects shared by the comparisons, None to fetch them on every run
+    report_format: <str>
+        format of the report file, 'xlsx', 'csv' or 'ndjson'
+    login_gerrit: <function>
+        returns the Gerrit client, gerrit_login by default
+    login_jira: <function>
+        returns the Jira client, the pooled client of jira_pool by default
+    stats: <RunStats>
+        time per stage, calls per endpoint family and time per project of the run
+    progress: <Progress>
+        stage and projects done of the comparison, polled by the job running it, the
+        changes of each project are published to it as soon as it is compared
     Methods
     --------------------------------
     get_repos(device)
         gets all the repos for the given device
     get_change_ids()
         gets the change ids of the release tags
+    project_tags(project, required)
+        gets the indexed release tags of the project
+    get_merged_changes(commits)
+        gets the merged changes of the given commits by change id
     compare_changes(source release tag change ids, target release tag change ids)
         checks the changes from target to source
+    freshness_token()
+        gets the newest merged change of the manifest project
     generate_report()
         generates the report from final data
     '''
@@ -49,7 +78,7 @@ class ReleaseComparison:
     projects_log = {}
     stage_1_data = []
     final_data = {}
-    repos_to_be_checked = []
+    repos_to_be_checked = set()
     devices = []
     manifests = None
     exceptional_repos = []
@@ -59,6 +88,13 @@ class ReleaseComparison:
         'primary_gerrit': 'https://gerrit.teamccp.com',
         'rdk_gerrit': 'https://code.rdkcentral.com'
     }
+    project_workers = load_executor_settings()['project_workers']
+    merged_chunk_size = 50
+    tag_index = shared_tag_index
+    report_format = 'xlsx'
+    login_gerrit = staticmethod(gerrit_login)
+    login_jira = staticmethod(jira_pool.get)
+    progress = Progress()
 
     def __init__(self, source_release_no, target_release_no, source_release_tag,
                  target_release_tag, selected_device_release, project_name=None, manifest_file=None,
@@ -98,6 +134,10 @@ class ReleaseComparison:
 
         with open(self.BASE_DIR+'/config/manifests.json', 'r') as manifest_file:
             self.manifests = json.load(manifest_file)
+        self.fetch_stats = FetchProfileStats()
+        self.stats = RunStats(self.fetch_stats)
+        self.final_data = {}
+        self.exceptional_repos = []
 
         self.manifest_project = self.manifests[self.selected_device_release]['project']
 
@@ -163,8 +203,7 @@ class ReleaseComparison:
             if self.manifests[self.selected_device_release]['manifest_file'].split('.')[-1].lower() == 'xml':
                 manifest = xmltodict.parse(self.gerrit.get(manifest_api))
                 for project in manifest['manifest']['project']:
-                    if project['@name'] not in self.repos_to_be_checked:
-                        self.repos_to_be_checked.append(project['@name'])
+                    self.repos_to_be_checked.add(project['@name'])
             elif self.manifests[self.selected_device_release]['manifest_file'].split('.')[-1].lower() == 'git':
                 manifest_data = self.gerrit.get(manifest_api)
                 start = manifest_data.find('{', manifest_data.find('\ndeps') + 1)
@@ -173,8 +212,7 @@ class ReleaseComparison:
                 for project_url in manifest.values():
                     if 'gerrit.teamccp.com' in project_url:
                         project = '/'.join(project_url.split('gerrit.teamccp.com')[-1].split('@')[0].split('/')[1:])
-                        if project not in self.repos_to_be_checked:
-                            self.repos_to_be_checked.append(project)
+                        self.repos_to_be_checked.add(project)
         except Exception as e:
             print(e)
             if str(e).find('401 Client Error')!=-1:
@@ -196,7 +234,7 @@ class ReleaseComparison:
             project_name=project_list[0]
             spec_file=project_list[1]
 
-                        log_api_template_spec_file = '/plugins/gitiles/%s/+log/%s/%s' % (project_name, tag_version,spec_file)
+            log_api_template_spec_file = '/plugins/gitiles/%s/+log/%s/%s' % (project_name, tag_version,spec_file)
             next = ''
             cbreak = False
             while True:
@@ -418,6 +456,9 @@ class ReleaseComparison:
 
 
     def get_tags(self, tag_api):
+        '''
+        Returns the tags of the given tags API, None when the call failed
+        '''
         try:
             tags = self.gerrit.get(tag_api)
         except requests.exceptions.HTTPError as e:
@@ -427,43 +468,73 @@ class ReleaseComparison:
             # self.exceptional_repos.append(project)
             # print('Error while calling tag api')
             # break
-            tags = []
+            tags = None
         except requests.exceptions.RetryError as e:
             print('**************Retry Error ***********************')
-            tags = []
+            tags = None
         except requests.exceptions.ReadTimeout as e:
             print('**************Retry Error ***********************')
-            tags = []
+            tags = None
 
         return tags
 
+    def project_tags(self, project, required=()):
+        '''
+        Gets the release tags of the model in the given project, all of them are fetched
+        with one tags query and parsed once. Indexed tags without one of the required
+        versions are fetched again, the tag may be newer than the index entry.
+        '''
+        tag_api = '/projects/%s/tags?m=%s' % (project.replace('/', '%2F'), self.model_full_name)
+        if self.tag_index is None:
+            return ProjectTags(self.get_tags(tag_api) or [], self.model_full_name)
+        return self.tag_index.project_tags(self.gerrit.url, project, self.model_full_name,
+                                           lambda: self.get_tags(tag_api), required)
+
+    def merged_changes_api(self, commits):
+        '''
+        Gets the query of the merged changes of the given commits, the start offset is appended
+        '''
+        return '/changes/?q=(%s)+status:merged%s&S=' % (
+            '+OR+'.join('commit:' + commit for commit in commits), fetch_options('minimal'))
+
+    def get_merged_changes(self, commits):
+        '''
+        Gets the merged changes of the given commits indexed by change id, the commits are
+        looked up merged_chunk_size at a time with OR-ed commit: terms
+
+        Parameters
+        --------------------------------
+        commits: <iterable>
+            commit shas
+        '''
+        commits = sorted(set(commits))
+        changes_apis = [self.merged_changes_api(commits[index:index + self.merged_chunk_size])
+                        for index in range(0, len(commits), self.merged_chunk_size)]
+        pages = [self.gerrit.get(changes_api + '0', fetch_profile='minimal')
+                 for changes_api in changes_apis]
+
+        merged_changes = {}
+        for changes_api, page in zip(changes_apis, pages):
+            offset = 0
+            while True:
+                for change in page:
+                    merged_changes.setdefault(change['change_id'], change)
+                if not page or not page[-1].get('_more_changes'):
+                    break
+                offset += len(page)
+                page = self.gerrit.get(changes_api + str(offset), fetch_profile='minimal')
+        return merged_changes
+
     def compare_changes(self, project):
         '''
         Checks thechanges in the target change ids with the source changes
         '''
 
         change_data = []
-        self.jira=jira_login()
-        target_change_ids = [change['change_id'] for change in self.target_commit_list[project]if change]
-        print( "target_change_ids"+str(target_change_ids))
-        source_change_ids = [change['change_id'] for change in self.source_commit_list[project]if change]
+        target_change_ids = ChangeIdIndex(change['change_id'] for change in self.target_commit_list[project]if change)
         source_commit_id=[change['commit']for change in self.source_commit_list[project]if change]
-        print("source_change_ids"+str(source_change_ids))
-        print("commit_id"+str(set(source_commit_id)))
-        
-        change_data_1=[]
-        for each in set(source_commit_id):
-            changes_template='/changes/?q=%s+status:Merged'%(each)
-            change=self.gerrit.get(changes_template)
-            change_data_1.append(change)
-
-        change_data_by_change_id=[]
-        for each in change_data_1:
-            if len(each)>1:
-                a_single=each[0]
-                change_data_by_change_id.append(a_single)
-            else:
-                change_data_by_change_id.append(each)
+
+        merged_changes = self.get_merged_changes(source_commit_id)
 
         # print('           ***************************************************')
         # print('           Target change ids: %s' %target_change_ids)
@@ -473,37 +544,14 @@ class ReleaseComparison:
         # print('           ***************************************************')
         for change_item in self.source_commit_list[project]:
             if change_item['change_id']  not in target_change_ids:
-                issue=list(set(change_item['issues']))
-                for each in issue:
-                    try:
-                        result=self.jira.issue(each)
-                        try:
-                            parent=result.fields.parent.key
-                            index=issue.index(each)
-                            issue[index]=parent
-                        except :
-                            pass
-                    except:
-                        pass
-
-                change_item['issues']=list(set(issue))
-                for each in change_data_by_change_id:
-                    if isinstance(each,list):
-                        for i in each:
-                            if i['change_id']==change_item['change_id']:
-                                print('change_id missing %s' % change_item['change_id'])
-                                a=i['submitted'].split('.')
-                                change_item['merge_time']=datetime.strptime(a[0],"%Y-%m-%d %H:%M:%S")+timedelta(hours=5, minutes=30)
-                                change_data.append(change_item)
-                            
-                    else:
-                        if each['change_id']==change_item['change_id']:
-                            print('change_id missing %s' % change_item['change_id'])
-                            a=each['submitted'].split('.')
-                            change_item['merge_time']=datetime.strptime(a[0],"%Y-%m-%d %H:%M:%S")+timedelta(hours=5, minutes=30)
-                            change_data.append(change_item)
-                             
-        
+                change_item['issues']=list(set(change_item['issues']))
+                merged_change = merged_changes.get(change_item['change_id'])
+                if merged_change:
+                    print('change_id missing %s' % change_item['change_id'])
+                    a=merged_change['submitted'].split('.')
+                    change_item['merge_time']=datetime.strptime(a[0],"%Y-%m-%d %H:%M:%S")+timedelta(hours=5, minutes=30)
+                    change_data.append(change_item)
+
         # self.final_data[self.current_gerrit]['changes'] = sorted(
         #     self.final_data[self.current_gerrit]['changes'],
         #     key = lambda x: datetime.strptime(x['merge_time'], '%a %b %d %H:%M:%S %Y %z'))
@@ -526,13 +574,18 @@ class ReleaseComparison:
             self.final_data[gerrit] = {
                 'changes': []
             }
-            if self.current_gerrit == 'primary_gerrit':
-                self.gerrit = gerrit_login(self.current_gerrit, primary_gerrit)
-            else:
-                self.gerrit = gerrit_login(self.current_gerrit, rdk_gerrit)
-            self.repos_to_be_checked = []
+            self.progress.stage('login')
+            with self.stats.timer('login'):
+                if self.current_gerrit == 'primary_gerrit':
+                    self.gerrit = self.stats.instrument(self.login_gerrit(self.current_gerrit, primary_gerrit))
+                else:
+                    self.gerrit = self.stats.instrument(self.login_gerrit(self.current_gerrit, rdk_gerrit))
+            size_connection_pool(self.gerrit, self.project_workers)
+            self.repos_to_be_checked = set()
             if not self.project_input:
-                self.get_repos()
+                self.progress.stage('manifests')
+                with self.stats.timer('manifests'):
+                    self.get_repos()
             else:
                 self.repos_to_be_checked = set(self.project_input.split(","))
             print('*************************Projects***********************************')
@@ -549,86 +602,83 @@ class ReleaseComparison:
             # self.repos_to_be_checked = ['rdk/components/generic/libunpriv/generic']
 
             self.projects_log = {}
-            pool = multiprocessing.Pool(processes=10)
 
             print(min_version_no, smallest_version, max_version)
             zip_list = [(project, project_count + 1, min_version_no, smallest_version, max_version)
                         for project_count, project in enumerate(self.repos_to_be_checked)]
 
-            results = pool.starmap(self.get_changes_for_project, zip_list)
+            # the work is network bound, threads sharing the instance and the session are
+            # enough and nothing has to be pickled
+            self.progress.stage('projects', len(zip_list))
+            with self.stats.timer('projects'), ThreadPoolExecutor(max_workers=self.project_workers) as executor:
+                results = list(executor.map(
+                    lambda args: self.stats.timed_project(args[0], self.get_changes_for_project, *args), zip_list))
 
             self.final_data[self.current_gerrit]['changes'] = [item for sublist in results for item in sublist]
+            self.progress.stage('jira', len(self.final_data[self.current_gerrit]['changes']))
+            with self.stats.timer('jira'):
+                resolve_parent_issues(self.final_data[self.current_gerrit]['changes'],
+                                      get_jira=lambda: self.stats.jira(self.login_jira()))
             self.final_data[self.current_gerrit]['changes'] = sorted(
                 self.final_data[self.current_gerrit]['changes'],
                 key=lambda x: x['merge_time'])
 
+        print('Change fetch profiles: %s' % self.fetch_stats.summary())
         return self.final_data
 
+    def freshness_token(self, primary_gerrit=None, rdk_gerrit=None):
+        '''
+        Gets the newest merged change of the manifest project on every gerrit, a new
+        release (or any other manifest change) changes the token and so the report cache key
+        '''
+        token = {}
+        for gerrit in self.gerrits:
+            creds = primary_gerrit if gerrit == 'primary_gerrit' else rdk_gerrit
+            changes = self.stats.instrument(self.login_gerrit(gerrit, creds)).get(
+                '/changes/?q=project:%s+status:merged&n=1' % quote(self.manifest_project, safe=''))
+            token[gerrit] = '%s@%s' % (changes[0]['_number'], changes[0]['updated']) if changes else None
+        return token
+
     def get_changes_for_project(self, project, project_count, min_version_no, smallest_version, max_version):
         # print('************', project, min_version_no, smallest_version, max_version)
-        # print(multiprocessing.current_process())
+        # print(threading.current_thread())
         print('--------------Checking for project "%s", "%s" out of "%s" ------------------' % (
             project, project_count, len(self.repos_to_be_checked)))
         change_data = []
         while True:
-            # Getting the tag list for min version(stable release) ex:4.2.0.0
-            tag_api = '/projects/%s/tags?m=%s_%s' % (project.replace('/', '%2F'),
-                                                     self.model_full_name, min_version_no)
-            tags = self.get_tags(tag_api)
-          
-
-            tag_versions = [tag['ref'].split('_')[-1] for tag in tags]
-            if tag_versions:
-                latest_version = reduce(self.find_max_version, tag_versions)
+            # the tags of the min version (stable release) ex:4.2.0.0, of the smallest version
+            # and of the target tag are all looked up in the same project tags
+            with self.stats.timer('tags'):
+                tags = self.project_tags(project, (smallest_version, max_version))
+            latest_version = tags.latest_version(min_version_no)
+            if latest_version:
                 c1_version = self.find_min_version(smallest_version, latest_version)
                 #print("version_c1:"+str(c1_version))
 
-                # print('           Tag vesions: %s' % tag_versions)
                 # print('           Latest version is "%s"' % latest_version)
                 # print('           smallest version is "%s"' % smallest_version)
                 # print('           Min version of latest and source/target(C1 version):  %s' % c1_version)
                 # print('           Source release no:%s, Target release no:%s'
                 #       %(self.source_release_no, self.target_release_no))
 
-                if smallest_version in tag_versions:
-                    cpoint_commit_id_1 = tags[tag_versions.index(c1_version)]['object']
-                    cpoint_commit_id_2 = tags[tag_versions.index(smallest_version)]['object']
-                elif max_version in tag_versions:
+                if tags.find(smallest_version, min_version_no):
+                    cpoint_commit_id_1 = tags.find(c1_version)
+                    cpoint_commit_id_2 = tags.find(smallest_version)
+                elif tags.find(max_version, min_version_no):
                     cpoint_commit_id_1 = None
-                    cpoint_commit_id_2 = tags[tag_versions.index(max_version)]['object']
+                    cpoint_commit_id_2 = tags.find(max_version)
+                elif tags.find(smallest_version):
+                    cpoint_commit_id_2 = tags.find(smallest_version)
+                    cpoint_commit_id_1 = tags.find(c1_version)
                 else:
-                    stag_api = '/projects/%s/tags?m=%s_%s' % (project.replace('/', '%2F')
-                                                              , self.model_full_name, smallest_version)
-                    stags = self.get_tags(stag_api)
-                    stag_versions = [tag['ref'].split('_')[-1] for tag in stags]
-                    if stag_versions and smallest_version in stag_versions:
-                        cpoint_commit_id_2 = stags[stag_versions.index(smallest_version)]['object']
-                        if latest_version == c1_version:
-                            cpoint_commit_id_1 = tags[tag_versions.index(c1_version)]['object']
-                        else:
-                            cpoint_commit_id_1 = stags[stag_versions.index(c1_version)]['object']
-                    else:
-                        target_tag_api = '/projects/%s/tags?m=%s' % (
-                        project.replace('/', '%2F'), self.target_release_tag)
-                        target_tags = self.get_tags(target_tag_api)
-                        target_tag_versions = [tag['ref'].split('_')[-1] for tag in target_tags]
-                        cpoint_commit_id_1 = None
-                        if target_tag_versions and smallest_version in target_tag_versions:
-                            cpoint_commit_id_2 = target_tags[target_tag_versions.index(smallest_version)]['object']
-                        else:
-                            cpoint_commit_id_2 = None
+                    cpoint_commit_id_1 = None
+                    cpoint_commit_id_2 = tags.find(smallest_version, self.target_release_no)
             else:
                 # print('No tags found for stable release: %s' % min_version_no)
                 # print("Getting change ids with out check point")
                 # print('checking target tag available "%s"' %self.target_release_tag)
-                target_tag_api = '/project"s/%s/tags?m=%s' % (project.replace('/', '%2F'), self.target_release_tag)
-                tags = self.get_tags(target_tag_api)
-                tag_versions = [tag['ref'].split('_')[-1] for tag in tags]
                 cpoint_commit_id_1 = None
-                if tag_versions and smallest_version in tag_versions:
-                    cpoint_commit_id_2 = tags[tag_versions.index(smallest_version)]['object']
-                else:
-                    cpoint_commit_id_2 = None
+                cpoint_commit_id_2 = tags.find(smallest_version, self.target_release_no)
 
                 # self.exceptional_repos.append(project)
                 # print('Skipping project ...')
@@ -653,132 +703,57 @@ class ReleaseComparison:
 
             # print('           Max verison is "%s", first getting its change ids' % fmax_verison_tag)
 
-            check_point_commit_id = self.get_change_ids(project, fmax_verison_tag,
-                                                        cpoint_commit_id_1, cpoint_commit_id_2,
-                                                        True, to_append1)
-            print("check point commit id:"+str(check_point_commit_id))
-            self.get_change_ids(project, fmin_version_tag, check_point_commit_id,
-                                cpoint_commit_id_2, False, to_append2)
+            with self.stats.timer('log walks'):
+                check_point_commit_id = self.get_change_ids(project, fmax_verison_tag,
+                                                            cpoint_commit_id_1, cpoint_commit_id_2,
+                                                            True, to_append1)
+                print("check point commit id:"+str(check_point_commit_id))
+                self.get_change_ids(project, fmin_version_tag, check_point_commit_id,
+                                    cpoint_commit_id_2, False, to_append2)
 
 
-            change_data = self.compare_changes(project)
+            with self.stats.timer('merged changes'):
+                change_data = self.compare_changes(project)
             print('           ---------------Completed the project "%s"-------------' % (project_count))
             break
         # break
         # print('Exiting')
         print(change_data)
+        self.progress.advance()
+        self.progress.publish('project', {'gerrit': self.current_gerrit, 'project': project, 'changes': change_data})
 
         return change_data
 
     def generate_report(self):
         '''
-        Initializes the class instance with the required parameters Generates the final report
-        using the final data fetched
+        Generates the final report using the final data fetched, the rows are streamed
+        to the report file in the report format
         '''
-        book = xlwt.Workbook()
         if self.diff_report is True:
-            changes_sheet = book.add_sheet('diff_changes')
-            report_file_name = 'reports/%s_%s_%s_%s.xls' \
-                               % (self.target_release_no,
-                                  self.source_release_no,
-                                  'diff_report',
-                                  datetime.now().strftime('%d_%m_%Y_%H_%M_%S'))
+            sheet_title = 'diff_changes'
+            report_name = 'reports/%s_%s_%s_%s' \
+                          % (self.target_release_no,
+                             self.source_release_no,
+                             'diff_report',
+                             datetime.now().strftime('%d_%m_%Y_%H_%M_%S'))
         else:
-            changes_sheet = book.add_sheet('missing_changes')
-            report_file_name = 'reports/%s_%s_%s_%s.xls' \
-                               % (self.source_release_no,
-                                  self.target_release_no,
-                                  'missing_report',
-                                  datetime.now().strftime('%d_%m_%Y_%H_%M_%S'))
-
-        style_header = xlwt.easyxf('pattern: pattern solid, fore_colour gray40;' 'font: bold True;')
-        styles = {
-            'revert': {
-                'style_bg': xlwt.easyxf('font: colour red;'),
-                'style_center': xlwt.easyxf('alignment: vertical center;' 'font: colour red;'),
-                'style_link': xlwt.easyxf('font: colour red, underline single;')
-            },
-            'normal': {
-                'style_bg': xlwt.easyxf(''),
-                'style_center': xlwt.easyxf('alignment: vertical center;'),
-                'style_link': xlwt.easyxf('font: colour blue, underline single;')
-            }
-        }
-
-        col_width = {
-            'changes': {
-                'project': 7,
-                'merge_time': 10,
-                'change_id': 9,
-                'issues': 7,
-                'revert': 6
-            }
-        }
-
-        changes_sheet.write(0, 0, 'Merge Time', style_header)
-        changes_sheet.write(0, 1, 'Change Id', style_header)
-        changes_sheet.write(0, 2, 'Project', style_header)
-        changes_sheet.write(0, 3, 'Issues', style_header)
-        changes_sheet.write(0, 4, 'Revert', style_header)
+            sheet_title = 'missing_changes'
+            report_name = 'reports/%s_%s_%s_%s' \
+                          % (self.source_release_no,
+                             self.target_release_no,
+                             'missing_report',
+                             datetime.now().strftime('%d_%m_%Y_%H_%M_%S'))
 
         gerrit_switch = False
-        row = 1
-        sheet = changes_sheet
-        change_type = 'changes'
-
-        for gerrit in self.final_data.keys():
-            if gerrit_switch:
-                sheet.write(row, 0, '')
-                sheet.write(row, 1, '')
-                sheet.write(row, 2, '')
-                sheet.write(row, 3, '')
-                row += 1
-            gerrit_switch = True
-            for change in self.final_data[gerrit][change_type]:
-                if len(str(change['merge_time'])) > col_width[change_type]['merge_time']:
-                    col_width[change_type]['merge_time'] = len(str(change['merge_time']))
-                if len(change['change_id']) > col_width[change_type]['change_id']:
-                    col_width[change_type]['change_id'] = len(change['change_id'])
-                joined_issues = ','.join(change['issues'])
-                if len(change['project']) > col_width[change_type]['project']:
-                    col_width[change_type]['project'] = len(change['project'])
-                if len(joined_issues) > col_width[change_type]['issues']:
-                    col_width[change_type]['issues'] = len(joined_issues)
-                if change['is_revert']:
-                    style = 'revert'
-                else:
-                    style = 'normal'
-
-
-                sheet.write(row, 0,change['merge_time'], styles[style]['style_bg'])
-                sheet.write(row, 1, xlwt.Formula(
-                    'HYPERLINK("{}","{}")'.format(self.gerrit_urls[gerrit] + '/#/q/' + change['change_id'],
-                                                  change['change_id'])), styles[style]['style_link'])
-                sheet.write(row, 2, change['project'], styles[style]['style_center'])
-                sheet.write(row, 3, joined_issues, styles[style]['style_bg'])
-                sheet.write(row, 4, 'YES' if change['is_revert'] else 'NO', styles[style]['style_bg'])
-                row += 1
-
-        for sheet in col_width.keys():
-            for col in col_width[sheet].keys(): col_width[sheet][col] = 254 if col_width[sheet][col] > 254 else \
-            col_width[sheet][col]
-
-        changes_sheet.col(0).width = int(col_width['changes']['merge_time'] * 256)
-        changes_sheet.col(1).width = int(col_width['changes']['change_id'] * 256)
-        changes_sheet.col(2).width = int(col_width['changes']['project'] * 256)
-        changes_sheet.col(3).width = int((col_width['changes']['issues'] + 1) * 256)
-        changes_sheet.col(4).width = int(col_width['changes']['revert'] * 256)
-
-        changes_sheet.set_horz_split_pos(1)
-        changes_sheet.set_vert_split_pos(1)
-        changes_sheet.panes_frozen = True
-        changes_sheet.remove_splits = True
-
-
-
-        book.save(self.BASE_DIR+'/'+report_file_name)
+        with report_writer(self.report_format, self.BASE_DIR + '/' + report_name, sheet_title) as writer:
+            for gerrit in self.final_data.keys():
+                if gerrit_switch:
+                    writer.write_blank()
+                gerrit_switch = True
+                for change in self.final_data[gerrit]['changes']:
+                    writer.write_change(self.gerrit_urls[gerrit], change, change['merge_time'])
 
-        return report_file_name
+        return report_name + '.' + writer.extension
 
 
 if __name__ == '__main__':
@@ -858,4 +833,5 @@ if __name__ == '__main__':
 
     end = datetime.now()
 
+    print('Issue parent cache: %s' % parent_cache_stats())
     print("Total Time:%s" % (end - start))
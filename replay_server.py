@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fixtures import FixtureStore
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    '''
+    Answers "/<service>/<path>" with the fixture recorded for the path of the service,
+    404 when nothing was recorded for it
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def replay(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        service, _, path = self.path.lstrip('/').partition('/')
+        fixture = self.server.store.find(service, self.command, '/' + path, body)
+        self.server.wait()
+        if fixture is None:
+            self.server.count('misses')
+            print('No fixture for %s %s' % (self.command, self.path))
+            content = ('No fixture for %s %s\n' % (self.command, self.path)).encode('utf-8')
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+        else:
+            self.server.count('hits')
+            content = fixture['body']
+            self.send_response(fixture['status'])
+            if fixture.get('content_type'):
+                self.send_header('Content-Type', fixture['content_type'])
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = replay
+    do_POST = replay
+    do_PUT = replay
+    do_DELETE = replay
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    '''
+    Local stand-in of the Gerrit and Jira servers replaying recorded fixtures, every
+    response is delayed by latency plus or minus jitter seconds
+
+    Attributes
+    --------------------------------
+    store: <FixtureStore>
+        recorded fixtures
+    latency: <float>
+        mean delay of a response in seconds
+    jitter: <float>
+        maximum deviation from the mean delay in seconds
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address, store, latency=0.0, jitter=0.0, seed=None, verbose=False):
+        super().__init__(address, ReplayHandler)
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.verbose = verbose
+        self.counters = {'hits': 0, 'misses': 0}
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            delay = self.random.uniform(self.latency - self.jitter, self.latency + self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replays recorded Gerrit and Jira responses, point the "urls" '
+                                                 'of config/standin.json to http://<host>:<port>/<service>/')
+    parser.add_argument('--fixtures', default='fixtures', help='fixture directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0, help='mean delay of a response')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='maximum deviation from the mean delay')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the delays, for reproducible runs')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    server = ReplayServer((args.host, args.port), FixtureStore(args.fixtures), args.latency_ms / 1000.0,
+                          args.jitter_ms / 1000.0, args.seed, args.verbose)
+    print('Replaying %s on http://%s:%s/' % (args.fixtures, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Replayed %(hits)s responses, %(misses)s requests without fixture' % server.counters)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache_settings import BASE_DIR, CACHE_DIR, load_cache_settings
+
+DEFAULTS = {
+    'enabled': True,
+    'path': CACHE_DIR + '/report_cache.sqlite3',
+    'max_age_seconds': 6 * 3600,
+    'quota_mb': 512
+}
+
+
+class ReportCache:
+    '''
+    Content-addressed cache of the comparison results and their report files. The key
+    is the hash of the normalized request and of a freshness token (the newest merged
+    change of the compared branches or manifest), so an identical request gets the
+    existing report back until something new is merged. Entries older than max_age are
+    dropped and the least recently used ones are evicted, report files included, when
+    the reports exceed the disk quota.
+
+    Attributes
+    --------------------------------
+    path: <str>
+        SQLite database file
+    max_age: <int>
+        seconds a report stays valid
+    quota: <int>
+        bytes of cached report files and results kept
+    hits: <int>
+        requests served from the cache
+    misses: <int>
+        requests missing or expired in the cache
+
+    Methods
+    --------------------------------
+    key(request, token)
+        returns the cache key of the normalized request and the freshness token
+    get(key)
+        returns the cached results of the key, None when missing or expired
+    put(key, results, report_file)
+        stores the results and their report file
+    stats()
+        returns the cache counters
+    '''
+
+    def __init__(self, path=DEFAULTS['path'], max_age_seconds=DEFAULTS['max_age_seconds'],
+                 quota_mb=DEFAULTS['quota_mb']):
+        self.path = path
+        self.max_age = max_age_seconds
+        self.quota = int(quota_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS report_cache ('
+                                    'cache_key TEXT PRIMARY KEY, results TEXT NOT NULL, report_file TEXT, '
+                                    'size INTEGER NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS report_cache_used_at '
+                                    'ON report_cache (used_at)')
+            self.connection.commit()
+        return self.connection
+
+    @staticmethod
+    def key(request, token):
+        '''
+        Returns the cache key of the given request and freshness token
+
+        Parameters
+        --------------------------------
+        request: <dict>
+            normalized request, every value which changes the report
+        token: <str>
+            freshness token of the compared data
+        '''
+        return hashlib.sha256(json.dumps([request, token], sort_keys=True, default=str)
+                              .encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def remove_report(report_file):
+        if report_file:
+            try:
+                os.remove(os.path.join(BASE_DIR, report_file))
+            except FileNotFoundError:
+                pass
+
+    def delete(self, connection, rows):
+        for cache_key, report_file in rows:
+            connection.execute('DELETE FROM report_cache WHERE cache_key = ?', (cache_key,))
+            self.remove_report(report_file)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute('SELECT results, report_file, created_at FROM report_cache '
+                                     'WHERE cache_key = ?', (key,)).fetchone()
+            if row and (now - row[2] > self.max_age or
+                        (row[1] and not os.path.exists(os.path.join(BASE_DIR, row[1])))):
+                self.delete(connection, [(key, row[1])])
+                connection.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute('UPDATE report_cache SET used_at = ? WHERE cache_key = ?', (now, key))
+            connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, results, report_file):
+        '''
+        Stores the results and their report file, then drops the expired entries and the
+        least recently used ones above the disk quota
+
+        Parameters
+        --------------------------------
+        key: <str>
+            cache key of the request
+        results: <dict>
+            response data of the comparison
+        report_file: <str>
+            report file relative to the application directory
+        '''
+        results = json.dumps(results, default=str)
+        size = len(results)
+        if report_file and os.path.exists(os.path.join(BASE_DIR, report_file)):
+            size += os.path.getsize(os.path.join(BASE_DIR, report_file))
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            previous = connection.execute('SELECT report_file FROM report_cache WHERE cache_key = ?',
+                                          (key,)).fetchone()
+            if previous and previous[0] != report_file:
+                self.remove_report(previous[0])
+            connection.execute('INSERT OR REPLACE INTO report_cache VALUES (?, ?, ?, ?, ?, ?)',
+                               (key, results, report_file, size, now, now))
+            self.delete(connection, connection.execute(
+                'SELECT cache_key, report_file FROM report_cache WHERE created_at < ?',
+                (now - self.max_age,)).fetchall())
+            total = 0
+            evicted = []
+            for cache_key, report_file, entry_size in connection.execute(
+                    'SELECT cache_key, report_file, size FROM report_cache ORDER BY used_at DESC').fetchall():
+                total += entry_size
+                if total > self.quota and cache_key != key:
+                    evicted.append((cache_key, report_file))
+            self.delete(connection, evicted)
+            connection.commit()
+
+    def stats(self):
+        '''
+        Returns the hit/miss counters, the number of stored reports and their size
+        '''
+        with self.lock:
+            entries, size = self.connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) '
+                                                   'FROM report_cache').fetchone()
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+                'entries': entries,
+                'bytes': size
+            }
+
+
+def report_cache():
+    '''
+    Returns the report cache configured in config/cache.json, None when disabled
+    '''
+    settings = load_cache_settings('report_cache', DEFAULTS)
+    if not settings['enabled']:
+        return None
+    return ReportCache(settings['path'], settings['max_age_seconds'], settings['quota_mb'])
+
+
+shared_report_cache = report_cache()
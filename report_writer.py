@@ -0,0 +1,196 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+
+# Columns of the change reports and their widths in characters, the widths are set
+# before the first row since a streamed sheet cannot be measured afterwards
+REPORT_COLUMNS = ['Merge Time', 'Change Id', 'Project', 'Issues', 'Revert']
+COLUMN_WIDTHS = [22, 44, 60, 30, 8]
+
+
+class ReportWriter(ABC):
+    '''
+    Writes a change report row by row as the changes are produced, nothing but the
+    current row is kept in memory. Same layout as the former xlwt reports: a header,
+    one blank row between the gerrits and the branch variant sections introduced by
+    their branch name.
+
+    Methods
+    --------------------------------
+    write_change(gerrit_url, change, merge_time, section)
+        writes one change, the change id linking to its Gerrit query
+    write_blank()
+        writes an empty row
+    write_section(title)
+        starts a section titled with the branch variant
+    close()
+        finishes the report file
+    '''
+
+    extension = None
+
+    def __init__(self, path, sheet_title, header=REPORT_COLUMNS):
+        self.path = path
+        self.sheet_title = sheet_title
+        self.header = header
+        self.rows = 0
+
+    @staticmethod
+    def change_link(gerrit_url, change):
+        return gerrit_url + '/#/q/' + change['change_id']
+
+    @abstractmethod
+    def write_change(self, gerrit_url, change, merge_time, section=None):
+        pass
+
+    def write_blank(self):
+        pass
+
+    def write_section(self, title):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class XlsxReportWriter(ReportWriter):
+    '''
+    .xlsx report streamed with the write-only mode of openpyxl, reverts are red and the
+    change ids are HYPERLINK formulas like in the former .xls reports
+    '''
+
+    extension = 'xlsx'
+    header_fill = PatternFill('solid', fgColor='969696')
+    center = Alignment(vertical='center')
+    styles = {
+        'revert': {
+            'font': Font(color='FF0000'),
+            'link': Font(color='FF0000', underline='single')
+        },
+        'normal': {
+            'font': Font(),
+            'link': Font(color='0000FF', underline='single')
+        }
+    }
+
+    def __init__(self, path, sheet_title, header=REPORT_COLUMNS):
+        super().__init__(path, sheet_title, header)
+        self.book = Workbook(write_only=True)
+        self.sheet = self.book.create_sheet(sheet_title)
+        for index, width in enumerate(COLUMN_WIDTHS):
+            self.sheet.column_dimensions[chr(ord('A') + index)].width = width
+        self.sheet.freeze_panes = 'B2'
+        self.sheet.append([self.cell(title, font=Font(bold=True), fill=self.header_fill) for title in header])
+
+    def cell(self, value, font=None, fill=None, alignment=None):
+        cell = WriteOnlyCell(self.sheet, value=value)
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if alignment is not None:
+            cell.alignment = alignment
+        return cell
+
+    def write_change(self, gerrit_url, change, merge_time, section=None):
+        style = self.styles['revert' if change['is_revert'] else 'normal']
+        self.sheet.append([
+            self.cell(merge_time, font=style['font']),
+            self.cell('=HYPERLINK("{}","{}")'.format(self.change_link(gerrit_url, change), change['change_id']),
+                      font=style['link']),
+            self.cell(change['project'], font=style['font'], alignment=self.center),
+            self.cell(','.join(change['issues']), font=style['font']),
+            self.cell('YES' if change['is_revert'] else 'NO', font=style['font'])
+        ])
+        self.rows += 1
+
+    def write_blank(self):
+        self.sheet.append([])
+
+    def write_section(self, title):
+        for count in range(3):
+            self.sheet.append([])
+        self.sheet.append([title])
+        self.sheet.append([])
+
+    def close(self):
+        self.book.save(self.path)
+
+
+class CsvReportWriter(ReportWriter):
+    '''
+    CSV report, the link of each change is written in an additional Link column
+    '''
+
+    extension = 'csv'
+
+    def __init__(self, path, sheet_title, header=REPORT_COLUMNS):
+        super().__init__(path, sheet_title, header)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(list(header) + ['Link'])
+
+    def write_change(self, gerrit_url, change, merge_time, section=None):
+        self.writer.writerow([merge_time, change['change_id'], change['project'], ','.join(change['issues']),
+                              'YES' if change['is_revert'] else 'NO', self.change_link(gerrit_url, change)])
+        self.rows += 1
+
+    def write_blank(self):
+        self.writer.writerow([])
+
+    def write_section(self, title):
+        self.writer.writerows([[], [], [], [title], []])
+
+    def close(self):
+        self.file.close()
+
+
+class NdjsonReportWriter(ReportWriter):
+    '''
+    NDJSON report, one JSON object per change carrying its section instead of layout rows
+    '''
+
+    extension = 'ndjson'
+
+    def __init__(self, path, sheet_title, header=REPORT_COLUMNS):
+        super().__init__(path, sheet_title, header)
+        self.file = open(path, 'w')
+
+    def write_change(self, gerrit_url, change, merge_time, section=None):
+        self.file.write(json.dumps({
+            'merge_time': merge_time,
+            'change_id': change['change_id'],
+            'link': self.change_link(gerrit_url, change),
+            'project': change['project'],
+            'issues': change['issues'],
+            'revert': bool(change['is_revert']),
+            'section': section
+        }) + '\n')
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+
+
+REPORT_WRITERS = {writer.extension: writer for writer in [XlsxReportWriter, CsvReportWriter, NdjsonReportWriter]}
+
+
+def report_writer(report_format, path_without_extension, sheet_title, header=REPORT_COLUMNS):
+    '''
+    Returns the report writer of the given format ('xlsx', 'csv' or 'ndjson') writing to
+    the path completed with the extension of the format
+    '''
+    if report_format not in REPORT_WRITERS:
+        raise Exception('Unsupported report format "%s"' % report_format)
+    writer = REPORT_WRITERS[report_format]
+    return writer('%s.%s' % (path_without_extension, writer.extension), sheet_title, header)
@@ -1,25 +1,192 @@
 #!/usr/bin/env python
 
 from pygerrit2 import GerritRestAPI, HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 import json
 import os
+import time
+import hashlib
+import threading
+
+from fixtures import record_responses, service_url
+from session_observers import observe_responses
+
+# Change query options requested by each fetch profile
+CHANGE_FETCH_PROFILES = {
+    'minimal': [],
+    'with-commit-message': ['CURRENT_REVISION', 'CURRENT_COMMIT'],
+    'full': ['CURRENT_REVISION', 'CURRENT_COMMIT', 'MESSAGES']
+}
+
+# Connections kept alive per pooled Gerrit session and idle time before it is closed
+GERRIT_POOL_SIZE = 32
+GERRIT_IDLE_SECONDS = 1800
 
 def gerrit_login(gerrit_key, creds=None):
+    '''
+    Returns the pooled Gerrit client of the given credentials, the configured ones by default
+    '''
     try:
-        gerrit_cred = None
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        with open(BASE_DIR+'/config/gerrit.json', 'r') as gerrit_file:
-            gerrit_cred = json.load(gerrit_file)
-        if not creds:
-            auth = HTTPBasicAuth(gerrit_cred[gerrit_key]['username'], gerrit_cred[gerrit_key]['password'])
-        else:
-            auth = HTTPBasicAuth(creds['username'], creds['password'])
-        gerrit = GerritRestAPI(url = gerrit_cred[gerrit_key]['url'], auth = auth)
-        print('Successfully logged into Gerrit...!')
-        return gerrit
+        return gerrit_pool.get(gerrit_key, creds)
     except Exception as e:
         print(e)
         raise Exception('Gerrit login failed')
 
+def size_connection_pool(gerrit, pool_size):
+    '''
+    Mounts an adapter keeping up to pool_size connections alive on the session of the
+    given Gerrit client, so that many threads can share the session without
+    reconnecting, the default adapter keeps 10. A session already pooled for as many
+    connections is left as is, so shared sessions keep their open connections
+    '''
+    if getattr(gerrit.session.get_adapter(gerrit.url), '_pool_maxsize', 0) >= pool_size:
+        return gerrit
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    gerrit.session.mount('https://', adapter)
+    gerrit.session.mount('http://', adapter)
+    return gerrit
+
+class GerritSessionPool:
+    '''
+    Gerrit clients kept per (gerrit_key, username). config/gerrit.json is parsed once and
+    again only when it changes, every client session keeps up to pool_size connections
+    alive and is shared by all the comparisons and endpoints using the same credentials.
+    A client answered with 401 is dropped, so the next login builds a new one, and
+    clients not used for idle_seconds are closed.
+
+    Methods
+    --------------------------------
+    get(gerrit_key, creds)
+        returns the client of the credentials, the configured ones when creds is empty
+    invalidate(key)
+        drops the client of the given pool key
+    stats()
+        returns the number of clients, logins, reuses, invalidations and expired clients
+    '''
+
+    def __init__(self, pool_size=GERRIT_POOL_SIZE, idle_seconds=GERRIT_IDLE_SECONDS):
+        self.pool_size = pool_size
+        self.idle_seconds = idle_seconds
+        self.config_path = os.path.dirname(os.path.abspath(__file__)) + '/config/gerrit.json'
+        self.config = None
+        self.config_mtime = None
+        self.clients = {}
+        self.counters = {'logins': 0, 'reuses': 0, 'invalidated': 0, 'expired': 0}
+        self.lock = threading.Lock()
+
+    def gerrit_config(self):
+        mtime = os.stat(self.config_path).st_mtime
+        with self.lock:
+            if self.config is None or mtime != self.config_mtime:
+                with open(self.config_path, 'r') as gerrit_file:
+                    self.config = json.load(gerrit_file)
+                self.config_mtime = mtime
+            return self.config
+
+    @staticmethod
+    def password_hash(password):
+        return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+    def expire(self, now):
+        expired = [key for key, client in self.clients.items() if now - client['used_at'] > self.idle_seconds]
+        for key in expired:
+            self.clients.pop(key)['gerrit'].session.close()
+        self.counters['expired'] += len(expired)
+
+    def get(self, gerrit_key, creds=None):
+        config = self.gerrit_config()[gerrit_key]
+        url = service_url(gerrit_key, config['url'])
+        if not creds:
+            creds = config
+        key = (gerrit_key, creds['username'])
+        password_hash = self.password_hash(creds['password'])
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            client = self.clients.get(key)
+            # a different password for the same user never reuses the session
+            if client and client['password_hash'] == password_hash and client['url'] == url:
+                client['used_at'] = now
+                self.counters['reuses'] += 1
+                return client['gerrit']
+
+        gerrit = GerritRestAPI(url=url, auth=HTTPBasicAuth(creds['username'], creds['password']))
+        gerrit.session.headers['Accept-Encoding'] = 'gzip'
+        observe_responses(gerrit.session, self.invalidate_on_401(key, gerrit))
+        record_responses(gerrit.session, gerrit_key, url)
+        size_connection_pool(gerrit, self.pool_size)
+        with self.lock:
+            self.clients[key] = {'gerrit': gerrit, 'password_hash': password_hash, 'url': url,
+                                 'used_at': now}
+            self.counters['logins'] += 1
+        print('Successfully logged into Gerrit...!')
+        return gerrit
+
+    def invalidate_on_401(self, key, gerrit):
+        def check_response(response):
+            if response.status_code == 401:
+                self.invalidate(key, gerrit)
+        return check_response
+
+    def invalidate(self, key, gerrit=None):
+        with self.lock:
+            client = self.clients.get(key)
+            if client and (gerrit is None or client['gerrit'] is gerrit):
+                del self.clients[key]
+                self.counters['invalidated'] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, clients=len(self.clients))
+
+
+gerrit_pool = GerritSessionPool()
+
+def fetch_options(profile):
+    '''
+    Returns the change query options of the given fetch profile
+    '''
+    return ''.join('&o=' + option for option in CHANGE_FETCH_PROFILES[profile])
+
+
+class FetchProfileStats:
+    '''
+    Counts the requests, the decoded payload bytes and the bytes received over the wire
+    (compressed) for each change fetch profile
+
+    Methods
+    --------------------------------
+    record(profile, payload_bytes, wire_bytes)
+        counts one response
+    count(profile, response)
+        counts one requests response
+    summary()
+        returns the counters per profile
+    '''
+
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def record(self, profile, payload_bytes, wire_bytes):
+        with self.lock:
+            counter = self.counters.setdefault(profile, {'requests': 0, 'payload_bytes': 0, 'wire_bytes': 0})
+            counter['requests'] += 1
+            counter['payload_bytes'] += payload_bytes
+            counter['wire_bytes'] += wire_bytes
+
+    def count(self, profile, response):
+        payload_bytes = len(response.content)
+        try:
+            wire_bytes = response.raw.tell()
+        except Exception:
+            wire_bytes = payload_bytes
+        self.record(profile, payload_bytes, wire_bytes or payload_bytes)
+
+    def summary(self):
+        with self.lock:
+            return {profile: dict(counter) for profile, counter in self.counters.items()}
+
+
 if __name__ == '__main__':
-    gerrit_login()    
+    gerrit_login('primary_gerrit')    
@@ -1,8 +1,18 @@
 import os
+import time
+import hashlib
+import threading
+import requests
 from jira import JIRA
 from jira.exceptions import JIRAError
 import json
 
+from issue_cache import issue_parent_cache
+from fixtures import record_responses, service_url
+
+JQL_CHUNK_SIZE = 100
+JIRA_IDLE_SECONDS = 1800
+
 
 def jira_login(username=None, pwd=None):
     credentials = {}
@@ -13,14 +23,229 @@ def jira_login(username=None, pwd=None):
         username = credentials['username']
         pwd = credentials['password']
 
-    jira_server = 'https://ccp.sys.comcast.net/'
+    jira_server = service_url('jira', 'https://ccp.sys.comcast.net/')
     jira_options = {'server': jira_server}
 
     jira = JIRA(options=jira_options, basic_auth=(username, pwd))
+    if record_responses(jira._session, 'jira', jira_server):
+        # fetched by the constructor before the recorder was attached, the client
+        # needs it when replayed
+        jira.server_info()
     print('Jira loggin successfull')
     return jira
 
 
+class JiraClientPool:
+    '''
+    Logged in Jira clients kept per credential set, the clients keep their session and
+    its keep-alive connections so projects, workers and requests using the same
+    credentials share one login. A client not used for idle_seconds is closed and
+    logged in again on the next use.
+
+    Methods
+    --------------------------------
+    get(username, pwd)
+        returns the Jira client of the credentials, same arguments as jira_login
+    discard(jira)
+        drops a client whose login is no longer valid
+    stats()
+        returns the number of clients, logins, reuses and expired clients
+    '''
+
+    def __init__(self, idle_seconds=JIRA_IDLE_SECONDS, login=jira_login):
+        self.idle_seconds = idle_seconds
+        self.login = login
+        self.clients = {}
+        self.counters = {'logins': 0, 'reuses': 0, 'expired': 0, 'discarded': 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(username, pwd):
+        if not username or not pwd:
+            return None
+        return username, hashlib.sha256(pwd.encode('utf-8')).hexdigest()
+
+    def expire(self, now):
+        expired = [key for key, (jira, used_at) in self.clients.items() if now - used_at > self.idle_seconds]
+        for key in expired:
+            self.close(self.clients.pop(key)[0])
+        self.counters['expired'] += len(expired)
+
+    @staticmethod
+    def close(jira):
+        try:
+            jira.close()
+        except Exception:
+            pass
+
+    def get(self, username=None, pwd=None):
+        key = self.key(username, pwd)
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            if key in self.clients:
+                jira = self.clients[key][0]
+                self.clients[key] = (jira, now)
+                self.counters['reuses'] += 1
+                return jira
+        jira = self.login(username, pwd)
+        with self.lock:
+            self.counters['logins'] += 1
+            self.clients[key] = (jira, now)
+        return jira
+
+    def discard(self, jira):
+        # instrumented clients wrap the pooled one in their jira attribute
+        jira = getattr(jira, 'jira', jira)
+        with self.lock:
+            for key in [key for key, (client, used_at) in self.clients.items() if client is jira]:
+                del self.clients[key]
+                self.counters['discarded'] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, clients=len(self.clients))
+
+
+jira_pool = JiraClientPool()
+
+
+class ParentIssueResolver:
+    '''
+    Resolves Jira issue keys to their parent issue keys with chunked JQL searches
+    which only return the parent field. Resolved keys are kept in the persistent
+    issue parent cache when it is enabled, in memory otherwise, so a key seen by
+    one comparison is not looked up again by the next one.
+
+    Methods
+    --------------------------------
+    resolve(issue_keys, get_jira)
+        resolves the parents of the given issue keys
+    '''
+
+    def __init__(self, chunk_size=JQL_CHUNK_SIZE, cache=None):
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.parents = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, issue_keys):
+        if self.cache is not None:
+            return self.cache.get_many(issue_keys)
+        with self.lock:
+            return {key: self.parents[key] for key in issue_keys if key in self.parents}
+
+    def store(self, parents):
+        if self.cache is not None:
+            self.cache.set_many(parents)
+        else:
+            with self.lock:
+                self.parents.update(parents)
+
+    def resolve(self, issue_keys, get_jira=jira_pool.get):
+        '''
+        Returns the parents of the given issue keys (None for issues without a parent),
+        Jira is only logged into when some of the keys are not resolved yet
+
+        Parameters
+        --------------------------------
+        issue_keys: <iterable>
+            issue keys found in the commit messages
+        get_jira: <callable>
+            returns a logged in Jira client
+        '''
+        issue_keys = set(issue_keys)
+        parents = self.lookup(issue_keys)
+        pending = sorted(issue_keys - set(parents.keys()))
+        if pending:
+            jira = get_jira()
+            try:
+                found = self.search_all(jira, pending)
+            except JIRAError as e:
+                if e.status_code != 401:
+                    raise
+                # the pooled login expired on the server, log in again once
+                jira_pool.discard(jira)
+                found = self.search_all(get_jira(), pending)
+            self.store(found)
+            parents.update(found)
+        return parents
+
+    def search_all(self, jira, issue_keys):
+        '''
+        Searches the parents of all the given issue keys chunk by chunk, the keys of a
+        chunk failing for another reason than invalid keys are left unresolved
+        '''
+        found = {}
+        for index in range(0, len(issue_keys), self.chunk_size):
+            chunk = issue_keys[index:index + self.chunk_size]
+            try:
+                found.update(self.search_parents(jira, chunk))
+            except JIRAError as e:
+                if e.status_code == 401:
+                    raise
+                print('Skipping the parents of %s issues, Jira search failed: %s' % (len(chunk), e.status_code))
+            except requests.exceptions.RequestException as e:
+                print('Skipping the parents of %s issues, Jira search failed: %s' % (len(chunk), e))
+        return found
+
+    def search_parents(self, jira, issue_keys):
+        '''
+        Searches the parents of one chunk of issue keys, a chunk rejected by Jira for an
+        invalid or nonexistent key (400) is split until the offending key is isolated,
+        any other error is raised
+        '''
+        jql = 'issue in (%s)' % ', '.join(issue_keys)
+        try:
+            issues = jira.search_issues(jql, maxResults=len(issue_keys), validate_query=False,
+                                        fields='parent')
+        except JIRAError as e:
+            if e.status_code not in (400, 404):
+                raise
+            if len(issue_keys) == 1:
+                return {issue_keys[0]: None}
+            middle = len(issue_keys) // 2
+            found = self.search_parents(jira, issue_keys[:middle])
+            found.update(self.search_parents(jira, issue_keys[middle:]))
+            return found
+
+        found = dict.fromkeys(issue_keys)
+        for issue in issues:
+            parent = getattr(issue.fields, 'parent', None)
+            if issue.key in found:
+                found[issue.key] = parent.key if parent else None
+        return found
+
+
+parent_resolver = ParentIssueResolver(cache=issue_parent_cache())
+
+
+def resolve_parent_issues(changes, get_jira=jira_pool.get, resolver=parent_resolver):
+    '''
+    Replaces the issues of all the given changes with their parent issues,
+    every issue key is collected first and resolved in a few JQL searches
+
+    Parameters
+    --------------------------------
+    changes: <list>
+        changes having the 'issues' list
+    '''
+    issue_keys = set(issue for change in changes for issue in change['issues'])
+    if not issue_keys:
+        return
+    parents = resolver.resolve(issue_keys, get_jira)
+    for change in changes:
+        change['issues'] = list(set(parents.get(issue) or issue for issue in change['issues']))
+
+
+def parent_cache_stats(resolver=parent_resolver):
+    '''
+    Returns the counters of the issue parent cache, None when the cache is disabled
+    '''
+    if resolver.cache is None:
+        return None
+    return resolver.cache.stats()
+
+
 if __name__ == '__main__':
     jira_login()
-
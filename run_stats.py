@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import observe_api_call
+from session_observers import observe_responses
+
+# families of the Gerrit endpoints, first match wins
+ENDPOINT_FAMILIES = [
+    ('gitiles log', re.compile(r'^/?plugins/gitiles/.*\+log')),
+    ('gitiles', re.compile(r'^/?plugins/gitiles/')),
+    ('change in', re.compile(r'^/?changes/[^?]+/in$')),
+    ('change query', re.compile(r'^/?changes/')),
+    ('project tags', re.compile(r'^/?projects/[^/]+/tags')),
+    ('file content', re.compile(r'^/?projects/[^/]+/.+/content$')),
+    ('branch', re.compile(r'^/?projects/[^/]+/branches/')),
+]
+
+# recorder of the responses received by the current thread for the Gerrit or Jira call
+# in progress, the observer of the client session looks it up here
+current_call = threading.local()
+
+
+def endpoint_family(endpoint):
+    for family, pattern in ENDPOINT_FAMILIES:
+        if pattern.search(endpoint):
+            return family
+    return 'other'
+
+
+def record_current_response(response):
+    recorder = getattr(current_call, 'recorder', None)
+    if recorder is not None:
+        recorder(response)
+
+
+class RunStats:
+    '''
+    Instrumentation of one comparison run: wall time per stage, calls, bytes, time and
+    errors per Gerrit/Jira endpoint family, duration per project and the bytes of the
+    change fetch profiles. Stages running in several threads add up the time of every
+    thread.
+
+    Methods
+    --------------------------------
+    timer(stage)
+        context manager timing a stage
+    timed_project(project, function, *args)
+        calls function(*args) and records its duration for the project
+    instrument(gerrit)
+        returns the Gerrit client recording its calls
+    jira(jira)
+        returns the Jira client recording its calls
+    summary()
+        returns all the counters
+    '''
+
+    def __init__(self, fetch_profiles=None):
+        self.fetch_profiles = fetch_profiles
+        self.started = time.monotonic()
+        self.stages = {}
+        self.endpoints = {}
+        self.projects = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, time.monotonic() - started)
+
+    def add_stage(self, stage, seconds):
+        with self.lock:
+            counter = self.stages.setdefault(stage, {'seconds': 0.0, 'count': 0})
+            counter['seconds'] += seconds
+            counter['count'] += 1
+
+    def timed_project(self, project, function, *args):
+        started = time.monotonic()
+        try:
+            return function(*args)
+        finally:
+            with self.lock:
+                self.projects[project] = self.projects.get(project, 0.0) + time.monotonic() - started
+
+    def record_call(self, family, seconds, response_bytes=0, status=None):
+        with self.lock:
+            counter = self.endpoints.setdefault(family, {'calls': 0, 'bytes': 0, 'seconds': 0.0, 'errors': {}})
+            counter['calls'] += 1
+            counter['bytes'] += response_bytes
+            counter['seconds'] += seconds
+            if status is not None:
+                counter['errors'][str(status)] = counter['errors'].get(str(status), 0) + 1
+        observe_api_call(family, seconds, status)
+
+    def instrument(self, gerrit):
+        return InstrumentedGerrit(gerrit, self)
+
+    def jira(self, jira):
+        return InstrumentedJira(jira, self)
+
+    def summary(self):
+        with self.lock:
+            summary = {
+                'total_seconds': round(time.monotonic() - self.started, 3),
+                'stages': {stage: {'seconds': round(counter['seconds'], 3), 'count': counter['count']}
+                           for stage, counter in self.stages.items()},
+                'endpoints': {family: dict(counter, seconds=round(counter['seconds'], 3),
+                                           errors=dict(counter['errors']))
+                              for family, counter in self.endpoints.items()},
+                'projects': {project: round(seconds, 3) for project, seconds in
+                             sorted(self.projects.items(), key=lambda item: item[1], reverse=True)}
+            }
+        if self.fetch_profiles is not None:
+            summary['fetch_profiles'] = self.fetch_profiles.summary()
+        return summary
+
+
+class InstrumentedGerrit:
+    '''
+    Gerrit client recording the family, time, size and error status of its calls, and
+    the bytes of the change pages requested with a fetch profile, everything else is
+    the wrapped client's
+    '''
+
+    def __init__(self, gerrit, stats):
+        self.gerrit = gerrit
+        self.stats = stats
+        observe_responses(gerrit.session, record_current_response)
+
+    def get(self, endpoint, fetch_profile=None, **kwargs):
+        family = 'gerrit ' + endpoint_family(endpoint)
+        received = {'bytes': 0}
+
+        def recorder(response):
+            received['bytes'] += len(response.content)
+            received['status'] = response.status_code if response.status_code >= 400 else None
+            if fetch_profile and self.stats.fetch_profiles is not None:
+                self.stats.fetch_profiles.count(fetch_profile, response)
+
+        current_call.recorder = recorder
+        started = time.monotonic()
+        try:
+            return self.gerrit.get(endpoint, **kwargs)
+        except Exception as e:
+            received.setdefault('status', type(e).__name__)
+            raise
+        finally:
+            current_call.recorder = None
+            self.stats.record_call(family, time.monotonic() - started, received['bytes'],
+                                   received.get('status'))
+
+    def __getattr__(self, name):
+        return getattr(self.gerrit, name)
+
+
+class InstrumentedJira:
+    '''
+    Jira client recording the time, size and error status of its public method calls,
+    the family of a call is the method name
+    '''
+
+    def __init__(self, jira, stats):
+        self.jira = jira
+        self.stats = stats
+        session = getattr(jira, '_session', None)
+        if session is not None:
+            observe_responses(session, record_current_response)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.jira, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            received = {'bytes': 0}
+
+            def recorder(response):
+                received['bytes'] += len(response.content)
+
+            current_call.recorder = recorder
+            started = time.monotonic()
+            status = None
+            try:
+                return attribute(*args, **kwargs)
+            except Exception as e:
+                status = getattr(e, 'status_code', None) or type(e).__name__
+                raise
+            finally:
+                current_call.recorder = None
+                self.stats.record_call('jira ' + name, time.monotonic() - started, received['bytes'], status)
+        return call
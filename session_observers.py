@@ -0,0 +1,28 @@
+def observe_responses(session, observer):
+    '''
+    Calls observer(response) for every response received by the given requests session.
+    The session's send is wrapped once and shared by all the observers: per call hooks
+    replace the session hooks in requests, so the observers cannot be session hooks.
+
+    Parameters
+    --------------------------------
+    session: <requests.Session>
+        session of a Gerrit or Jira client
+    observer: <callable>
+        called with each response, in the thread which made the request
+    '''
+    observers = getattr(session, 'response_observers', None)
+    if observers is None:
+        observers = session.response_observers = []
+        send = session.send
+
+        def observed_send(request, **kwargs):
+            response = send(request, **kwargs)
+            for response_observer in observers:
+                response_observer(response)
+            return response
+
+        session.send = observed_send
+    if observer not in observers:
+        observers.append(observer)
+    return session
@@ -0,0 +1,86 @@
+import threading
+import time
+from bisect import bisect_left
+
+from cache_settings import load_cache_settings
+
+DEFAULTS = {
+    'fresh_seconds': 300,
+    'max_stale_seconds': 86400
+}
+
+
+class ReleaseTagCache:
+    '''
+    In-process cache of the release tag lists served by /get_tags. A list younger than
+    fresh_seconds is served as is, an older one is still served (stale-while-revalidate)
+    while a background thread fetches it again, and one older than max_stale_seconds is
+    fetched before answering. The tags are kept sorted so prefix filters bisect them.
+
+    Methods
+    --------------------------------
+    get(key, fetch)
+        returns the sorted tags of the key, fetch() returns them when needed
+    with_prefix(tags, prefix)
+        returns the tags starting with prefix
+    stats()
+        returns the number of lists, hits, stale hits, fetches and refresh errors
+    '''
+
+    def __init__(self, fresh_seconds=DEFAULTS['fresh_seconds'], max_stale_seconds=DEFAULTS['max_stale_seconds']):
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.entries = {}
+        self.refreshing = set()
+        self.counters = {'hits': 0, 'stale_hits': 0, 'fetches': 0, 'refresh_errors': 0}
+        self.lock = threading.Lock()
+
+    def store(self, key, fetch):
+        tags = sorted(fetch())
+        with self.lock:
+            self.entries[key] = (tags, time.monotonic())
+            self.counters['fetches'] += 1
+        return tags
+
+    def refresh(self, key, fetch):
+        try:
+            self.store(key, fetch)
+        except Exception as e:
+            print('Refreshing the tags of %s failed: %s' % (key, e))
+            with self.lock:
+                self.counters['refresh_errors'] += 1
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def get(self, key, fetch):
+        with self.lock:
+            entry = self.entries.get(key)
+            age = time.monotonic() - entry[1] if entry else None
+            if entry and age < self.fresh_seconds:
+                self.counters['hits'] += 1
+                return entry[0]
+            if entry and age < self.max_stale_seconds:
+                self.counters['stale_hits'] += 1
+                if key not in self.refreshing:
+                    self.refreshing.add(key)
+                    threading.Thread(target=self.refresh, args=(key, fetch), daemon=True).start()
+                return entry[0]
+        return self.store(key, fetch)
+
+    @staticmethod
+    def with_prefix(tags, prefix):
+        if not prefix:
+            return tags
+        start = bisect_left(tags, prefix)
+        end = start
+        while end < len(tags) and tags[end].startswith(prefix):
+            end += 1
+        return tags[start:end]
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, lists=len(self.entries))
+
+
+release_tag_cache = ReleaseTagCache(**load_cache_settings('release_tags', DEFAULTS))
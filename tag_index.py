@@ -0,0 +1,158 @@
+import threading
+import time
+from bisect import bisect_left
+from distutils.version import LooseVersion
+
+from cache_settings import load_cache_settings
+
+DEFAULTS = {
+    'enabled': True,
+    'ttl_seconds': 600
+}
+
+
+class ProjectTags:
+    '''
+    Release tags of one model in one project, parsed once. The tag names are
+    "<model>_<version>", the versions are kept sorted so the tags of a version prefix
+    (what the "?m=" filters of the tags API returned) are found with a bisection.
+
+    Methods
+    --------------------------------
+    find(version, prefix)
+        returns the commit of the version tag when the version starts with prefix
+    latest_version(prefix)
+        returns the highest version starting with prefix
+    '''
+
+    def __init__(self, tags, model_name):
+        self.commits = {}
+        for tag in tags:
+            model, _, version = tag['ref'].replace('refs/tags/', '').rpartition('_')
+            if model == model_name and version not in self.commits:
+                self.commits[version] = tag['object']
+        self.versions = sorted(self.commits)
+        self.latest = {}
+        self.lock = threading.Lock()
+
+    def find(self, version, prefix=''):
+        if not version.startswith(prefix):
+            return None
+        return self.commits.get(version)
+
+    def with_prefix(self, prefix):
+        start = bisect_left(self.versions, prefix)
+        end = start
+        while end < len(self.versions) and self.versions[end].startswith(prefix):
+            end += 1
+        return self.versions[start:end]
+
+    def latest_version(self, prefix):
+        with self.lock:
+            if prefix not in self.latest:
+                versions = self.with_prefix(prefix)
+                self.latest[prefix] = max(versions, key=LooseVersion) if versions else None
+            return self.latest[prefix]
+
+    def __len__(self):
+        return len(self.versions)
+
+
+class TagIndex:
+    '''
+    Tags of every (gerrit, project, model) fetched at most once per ttl_seconds and
+    shared by all the comparisons, concurrent comparisons needing the same project wait
+    for a single fetch. An indexed entry missing one of the versions a comparison
+    requires is fetched again once, the tag may have been created after the entry.
+
+    Methods
+    --------------------------------
+    project_tags(gerrit, project, model_name, fetch, required)
+        returns the ProjectTags, fetch() returns the tags when they are not indexed,
+        None when the fetch failed, which is not indexed
+    stats()
+        returns the number of projects indexed, fetches, refetches and hits
+    '''
+
+    def __init__(self, ttl_seconds=DEFAULTS['ttl_seconds']):
+        self.ttl_seconds = ttl_seconds
+        self.entries = {}
+        self.fetching = {}
+        self.counters = {'fetches': 0, 'refetches': 0, 'hits': 0}
+        self.lock = threading.Lock()
+
+    def lookup(self, key, now, required=(), fetched_since=None):
+        entry = self.entries.get(key)
+        if not entry or now - entry[1] >= self.ttl_seconds:
+            return None
+        # an entry fetched while waiting for the key is as fresh as a new fetch
+        if (fetched_since is None or entry[1] < fetched_since) and \
+                any(entry[0].find(version) is None for version in required):
+            if fetched_since is None:
+                self.counters['refetches'] += 1
+            return None
+        self.counters['hits'] += 1
+        return entry[0]
+
+    def project_tags(self, gerrit, project, model_name, fetch, required=()):
+        '''
+        Returns the indexed tags of the model in the project, fetched when missing,
+        expired or without one of the required versions
+
+        Parameters
+        --------------------------------
+        gerrit: <str>
+            URL of the gerrit of the project
+        project: <str>
+            project name
+        model_name: <str>
+            model of the tags
+        fetch: <callable>
+            returns the tags of the project, None when the call failed
+        required: <iterable>
+            versions the caller needs, an entry without one of them is fetched again
+        '''
+        key = (gerrit, project, model_name)
+        with self.lock:
+            started = time.monotonic()
+            project_tags = self.lookup(key, started, required)
+            if project_tags is not None:
+                return project_tags
+            key_lock = self.fetching.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                project_tags = self.lookup(key, time.monotonic(), required, started)
+            if project_tags is not None:
+                return project_tags
+            tags = fetch()
+            project_tags = ProjectTags(tags or [], model_name)
+            now = time.monotonic()
+            with self.lock:
+                self.counters['fetches'] += 1
+                if tags is None:
+                    # a failed fetch is not shared, the next comparison fetches again
+                    self.fetching.pop(key, None)
+                    return project_tags
+                for stale_key in [stale_key for stale_key, entry in self.entries.items()
+                                  if now - entry[1] >= self.ttl_seconds]:
+                    del self.entries[stale_key]
+                self.entries[key] = (project_tags, now)
+                self.fetching.pop(key, None)
+            return project_tags
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, projects=len(self.entries))
+
+
+def tag_index():
+    '''
+    Returns the tag index configured in config/cache.json, None when disabled
+    '''
+    settings = load_cache_settings('tag_index', DEFAULTS)
+    if not settings['enabled']:
+        return None
+    return TagIndex(settings['ttl_seconds'])
+
+
+shared_tag_index = tag_index()